@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+"""News ranking cost on a large table.
+
+    python bench_post_rank.py [posts]
+
+Uses a temporary database, the site database is not touched. "top 100" is
+the old hourly job which recalculated the latest 100 posts one by one, "all"
+the vectorized pass over every post: the first run rewrites every rank, the
+next one an hour later only the ranks which changed noticeably. "news page"
+is the query of list_news() with and without the index on rank, "page 500"
+a deep page numbered (OFFSET and COUNT) and by cursor (keyset)."""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from flask_se_config import post_ranking_score, get_hours_since
+from se_models import db, Posts, Users, recalculate_post_rank
+from se_pagination import KeysetPage, encode_cursor
+
+
+def fill_posts(count):
+    db.session.add(Users(id=1, email="author@example.com", first_name="Author"))
+    now = datetime.utcnow()
+    rows = []
+    for i in range(count):
+        created_on = now - timedelta(hours=random.uniform(0, 3 * 365 * 24))
+        rows.append(
+            {
+                "title": "Новость %d" % i,
+                "votes": random.randint(-3, 40),
+                "views": random.randint(1, 500),
+                "created_on": created_on,
+                "updated_on": created_on,
+                "rank": 0.0,
+                "author_id": 1,
+            }
+        )
+    db.session.execute(db.insert(Posts), rows)
+    db.session.commit()
+
+
+def recalculate_top_100():
+    posts = Posts.query.order_by(Posts.id.desc()).limit(100).all()
+
+    for post in posts:
+        age = get_hours_since(post.created_on)
+        post.rank = post_ranking_score(post.votes, age, post.views)
+
+    db.session.commit()
+    return len(posts)
+
+
+def one_hour_later():
+    Posts.query.update(
+        {Posts.created_on: db.func.datetime(Posts.created_on, "-1 hour")},
+        synchronize_session=False,
+    )
+    db.session.commit()
+
+
+def news_page():
+    return (
+        Posts.query.order_by(Posts.rank.desc())
+        .paginate(per_page=20, page=1, error_out=False)
+        .items
+    )
+
+
+def news_page_500():
+    return len(
+        Posts.query.order_by(Posts.rank.desc())
+        .paginate(per_page=20, page=500, error_out=False)
+        .items
+    )
+
+
+def news_page_500_keyset():
+    # The cursor a reader would have after scrolling through 499 pages
+    last = Posts.query.order_by(Posts.rank.desc(), Posts.id.desc()).offset(9979).first()
+    cursor = encode_cursor([last.rank, last.id])
+    return lambda: len(
+        KeysetPage(Posts.query, (Posts.rank, Posts.id), cursor, per_page=20).items
+    )
+
+
+def measure(name, func, repeat=1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - started) / repeat
+    print("%-26s %9.2f ms %s" % (name, elapsed * 1000, result))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    random.seed(0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(
+            directory, "bench.db"
+        )
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            fill_posts(count)
+            print("%d posts" % count)
+
+            measure("top 100 (old)", recalculate_top_100)
+            measure("all, first pass", recalculate_post_rank)
+            one_hour_later()
+            measure("all, an hour later", recalculate_post_rank)
+            measure("all, same hour", recalculate_post_rank)
+
+            measure("news page, rank index", lambda: len(news_page()), repeat=20)
+            measure("page 500, numbered", news_page_500, repeat=20)
+            measure("page 500, keyset", news_page_500_keyset(), repeat=20)
+            db.session.execute(db.text("DROP INDEX ix_posts_rank"))
+            measure("news page, no index", lambda: len(news_page()), repeat=20)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+"""Concurrent voting for news posts.
+
+    python bench_post_vote.py [processes] [votes per process]
+
+Uses a temporary database, the site database is not touched. Every process
+stands for a uWSGI worker and votes as random users for a few popular posts.
+"read-modify-write" is the old way: read the counter, change it in Python and
+write it back, "ledger" is vote_for_post(). After a run the counters are
+checked against the ledger: votes = 1 + upvotes - downvotes."""
+
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from flask import Flask
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from se_models import db, Posts, PostVote, Users, vote_for_post
+
+USERS = 200
+POSTS = 5
+
+
+def create_app(filename):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + filename
+    db.init_app(app)
+    return app
+
+
+def vote_read_modify_write(user_id, post_id, upvote):
+    value = 1 if upvote else -1
+    post = db.session.get(Posts, post_id)
+    vote = db.session.get(PostVote, (user_id, post_id))
+    if vote is None:
+        db.session.add(PostVote(user_id=user_id, post_id=post_id, upvote=upvote))
+        post.votes = post.votes + value
+    elif vote.upvote != upvote:
+        vote.upvote = upvote
+        post.votes = post.votes + 2 * value
+    else:
+        return False
+    db.session.commit()
+    return True
+
+
+def voter(filename, vote, seed, votes, results):
+    app = create_app(filename)
+    rnd = random.Random(seed)
+    errors = 0
+    with app.app_context():
+        for _ in range(votes):
+            user_id = rnd.randint(1, USERS)
+            post_id = rnd.randint(1, POSTS)
+            try:
+                vote(user_id, post_id, rnd.random() < 0.7)
+            except (OperationalError, IntegrityError):
+                # Database is locked or another process inserted the vote first
+                db.session.rollback()
+                errors += 1
+    results.put(errors)
+
+
+def run(filename, vote, processes, votes):
+    with create_app(filename).app_context():
+        PostVote.query.delete()
+        Posts.query.update({Posts.votes: 1})
+        db.session.commit()
+
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(
+            target=voter, args=(filename, vote, seed, votes, results)
+        )
+        for seed in range(processes)
+    ]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    errors = sum(results.get() for _ in workers)
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    with create_app(filename).app_context():
+        drift = 0
+        for post in Posts.query:
+            ups = PostVote.query.filter_by(post_id=post.id, upvote=True).count()
+            downs = PostVote.query.filter_by(post_id=post.id, upvote=False).count()
+            drift += abs(post.votes - (1 + ups - downs))
+    return elapsed, errors, drift
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    votes = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "bench.db")
+        with create_app(filename).app_context():
+            db.create_all()
+            db.session.add(Users(id=1, email="author@example.com", first_name="A"))
+            for i in range(POSTS):
+                db.session.add(Posts(title="Новость %d" % i, author_id=1))
+            db.session.commit()
+
+        total = processes * votes
+        for name, vote in (
+            ("read-modify-write", vote_read_modify_write),
+            ("ledger", vote_for_post),
+        ):
+            elapsed, errors, drift = run(filename, vote, processes, votes)
+            print(
+                "%-18s %6d votes %7.2f s %8.1f votes/s %5d failed %5d lost"
+                % (name, total, elapsed, total / elapsed, errors, drift)
+            )
+
+
+if __name__ == "__main__":
+    main()
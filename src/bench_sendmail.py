@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+"""Mail delivery throughput against a local SMTP server.
+
+    pip install aiosmtpd
+    python bench_sendmail.py [messages] [delay_ms]
+
+Uses a temporary database, the site database is not touched. delay_ms is
+added to every accepted message to imitate a remote server. The "per message"
+run reproduces the old behaviour: new connection and login for every
+notification and a commit per delivered row, "batched" is the scheduler job
+and "async" the mail dispatcher with 4 and 8 connections."""
+
+import asyncio
+import os
+import sys
+import tempfile
+import logging
+import time
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+from flask import Flask
+
+import se_sendmail
+from se_mail_dispatcher import MailDispatcher
+from se_sendmail import MAIL_BATCH_SIZE
+from se_models import db, Notification, Users
+
+SMTP_HOST = "127.0.0.1"
+SMTP_PORT = 8025
+
+
+class CountingHandler:
+    def __init__(self, delay):
+        self.delay = delay
+        self.received = 0
+        self.connections = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.connections += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.received += 1
+        return "250 OK"
+
+
+def accept_any_login(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=True)
+
+
+def fill_outbox(messages):
+    if db.session.get(Users, 1) is None:
+        db.session.add(Users(id=1, email="student@example.com", first_name="Student"))
+        db.session.flush()
+    db.session.execute(
+        db.insert(Notification),
+        [
+            {
+                "type": 0,
+                "recipient": 1,
+                "title": "Уведомление %d" % i,
+                "content": "<p>Новый комментарий к отчёту</p>" * 20,
+            }
+            for i in range(messages)
+        ],
+    )
+    db.session.commit()
+
+
+def send_sequential(batch_size, per_connection):
+    def send():
+        se_sendmail.MAIL_MESSAGES_PER_CONNECTION = per_connection
+        return se_sendmail.notification_send_mail(
+            batch_size=batch_size, host=SMTP_HOST, port=SMTP_PORT
+        )
+
+    return send
+
+
+def send_concurrent(connections):
+    def send():
+        dispatcher = MailDispatcher(
+            SMTP_HOST, SMTP_PORT, connections=connections, rate=1000000
+        )
+        return asyncio.run(dispatcher.drain())
+
+    return send
+
+
+def run(handler, messages, send):
+    fill_outbox(messages)
+    handler.received = handler.connections = 0
+
+    started = time.perf_counter()
+    sent = 0
+    while Notification.query.count():
+        sent += send()
+    elapsed = time.perf_counter() - started
+
+    assert sent == handler.received == messages
+    return elapsed, handler.connections
+
+
+def main():
+    # aiosmtpd warns about its own deprecated attributes on every login
+    logging.getLogger("mail.log").setLevel(logging.ERROR)
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    delay = (float(sys.argv[2]) if len(sys.argv) > 2 else 0) / 1000
+
+    handler = CountingHandler(delay)
+    controller = Controller(
+        handler,
+        hostname=SMTP_HOST,
+        port=SMTP_PORT,
+        authenticator=accept_any_login,
+        auth_require_tls=False,
+    )
+    controller.start()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(
+            directory, "bench.db"
+        )
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            per_connection = se_sendmail.MAIL_MESSAGES_PER_CONNECTION
+            for name, send in (
+                ("per message", send_sequential(1, 1)),
+                ("batched", send_sequential(MAIL_BATCH_SIZE, per_connection)),
+                ("async x4", send_concurrent(4)),
+                ("async x8", send_concurrent(8)),
+            ):
+                elapsed, connections = run(handler, messages, send)
+                print(
+                    "%-12s %6d messages %5d connections %7.2f s %8.1f msg/s"
+                    % (name, messages, connections, elapsed, messages / elapsed)
+                )
+
+    controller.stop()
+
+
+if __name__ == "__main__":
+    main()
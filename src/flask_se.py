@@ -7,7 +7,6 @@ import pytz
 from dateutil import tz
 from flask import Flask, render_template, make_response, redirect, url_for
 from flask_admin import Admin
-from flask_apscheduler import APScheduler
 from flask_frozen import Freezer
 from flask_migrate import Migrate
 from flaskext.markdown import Markdown
@@ -21,8 +20,6 @@ from flask_se_config import (
     SECRET_KEY,
     SQLITE_DATABASE_NAME,
     SQLITE_DATABASE_PATH,
-    plural_hours,
-    get_hours_since,
 )
 from se_models import (
     db,
@@ -36,7 +33,6 @@ from se_models import (
     Posts,
     DiplomaThemes,
     CurrentThesis,
-    recalculate_post_rank,
 )
 from flask_se_auth import (
     login_manager,
@@ -50,7 +46,14 @@ from flask_se_auth import (
     google_login,
     google_callback,
 )
-from flask_se_news import list_news, get_post, submit_post, post_vote, delete_post
+from flask_se_news import (
+    list_news,
+    fetch_news,
+    get_post,
+    submit_post,
+    post_vote,
+    delete_post,
+)
 from flask_se_admin import (
     SeAdminModelViewThesis,
     SeAdminIndexView,
@@ -61,6 +64,8 @@ from flask_se_admin import (
     SeAdminModelViewDiplomaThemes,
     SeAdminModelViewReviewDiplomaThemes,
     SeAdminModelViewCurrentThesis,
+    SeAdminMetricsView,
+    SeAdminSchedulerView,
 )
 from flask_se_scholarships import (
     get_scholarships_1,
@@ -85,6 +90,7 @@ from flask_se_diplomas import (
     delete_theme,
     edit_user_theme,
     fetch_themes,
+    fetch_themes_facets,
     archive_theme,
     unarchive_theme,
 )
@@ -108,14 +114,10 @@ from flask_se_internships import (
     delete_internship,
     update_internship,
     fetch_internships,
+    fetch_internships_facets,
     old_internships_index,
 )
 
-from se_sendmail import (
-    notification_send_mail,
-    notification_send_diploma_themes_on_review,
-)
-
 from flask_se_practice import (
     practice_index,
     practice_guide,
@@ -143,6 +145,12 @@ from flask_se_practice_admin import (
     archive_thesis,
 )
 from flask_se_practice_yandex_disk import yandex_code
+from se_metrics import init_metrics, metrics
+from se_sendmail import outbox_metrics
+from se_view_counter import view_counter
+from se_news_block import news_block
+from se_feeds import news_feed, theses_feed
+from se_leader import LeaderElection
 
 app = Flask(
     __name__,
@@ -193,6 +201,7 @@ app.add_url_rule("/google_callback", methods=["GET"], view_func=google_callback)
 
 # Theses
 app.add_url_rule("/theses.html", view_func=flask_se_theses.theses_search)
+app.add_url_rule("/theses/atom.xml", endpoint="theses_feed", view_func=theses_feed.get)
 app.add_url_rule("/fetch_theses", view_func=flask_se_theses.fetch_theses)
 app.add_url_rule(
     "/post_theses", methods=["GET", "POST"], view_func=flask_se_theses.post_theses
@@ -206,6 +215,8 @@ app.add_url_rule("/thesis_download", view_func=flask_se_theses.download_thesis)
 # News
 app.add_url_rule("/news/", view_func=list_news)
 app.add_url_rule("/news/index.html", view_func=list_news)
+app.add_url_rule("/news/fetch_news", view_func=fetch_news)
+app.add_url_rule("/news/atom.xml", endpoint="news_feed", view_func=news_feed.get)
 app.add_url_rule("/news/item.html", view_func=get_post)
 app.add_url_rule("/news/submit.html", methods=["GET", "POST"], view_func=submit_post)
 app.add_url_rule("/news/post_vote", methods=["GET", "POST"], view_func=post_vote)
@@ -241,6 +252,7 @@ app.add_url_rule(
     "/diplomas/edit_theme.html", methods=["GET", "POST"], view_func=edit_user_theme
 )
 app.add_url_rule("/diplomas/fetch_themes", view_func=fetch_themes)
+app.add_url_rule("/diplomas/fetch_themes_facets", view_func=fetch_themes_facets)
 app.add_url_rule("/diplomas/archive_theme", view_func=archive_theme)
 app.add_url_rule("/diplomas/unarchive_theme", view_func=unarchive_theme)
 
@@ -285,6 +297,11 @@ app.add_url_rule(
 app.add_url_rule(
     "/internships/fetch_internships", methods=["GET"], view_func=fetch_internships
 )
+app.add_url_rule(
+    "/internships/fetch_internships_facets",
+    methods=["GET"],
+    view_func=fetch_internships_facets,
+)
 app.add_url_rule("/internships/add", methods=["GET", "POST"], view_func=add_internship)
 app.add_url_rule(
     "/internships/<int:id>", methods=["GET", "POST"], view_func=page_internship
@@ -386,6 +403,14 @@ search.init_app(app)
 # search.create_index(Thesis, update=True)
 # search.create_index(Users, update=True)
 
+# Init per-endpoint request, SQL and template timings
+init_metrics(app)
+# Outbox gauges are read from the database by the process serving the scrape
+metrics.add_collector(outbox_metrics)
+
+# Init write-behind post view counting
+view_counter.init_app(app)
+
 # Init Migrate
 migrate = Migrate(app, db, render_as_batch=True)
 
@@ -404,43 +429,9 @@ login_manager.init_app(app)
 Markdown(app, extensions=["tables"])
 
 
-def recalculate_post_rank_wrapper():
-    with app.app_context():
-        recalculate_post_rank()
-
-
-def notification_send_mail_wrapper():
-    with app.app_context():
-        notification_send_mail()
-
-
-def notification_send_diploma_themes_on_review_wrapper():
-    with app.app_context():
-        notification_send_diploma_themes_on_review()
-
-
-# Init APScheduler
-app.config["SCHEDULER_TIMEZONE"] = "UTC"
-scheduler = APScheduler()
-scheduler.add_job(
-    id="RecalculatePostRank",
-    func=recalculate_post_rank_wrapper,
-    trigger="interval",
-    seconds=3600,
-)
-scheduler.add_job(
-    id="SendMailNotification",
-    func=notification_send_mail_wrapper,
-    trigger="interval",
-    seconds=10,
-)
-scheduler.add_job(
-    id="SendDiplomaThemesOnReviewNotification",
-    func=notification_send_diploma_themes_on_review_wrapper,
-    trigger="interval",
-    seconds=86400,
-)
-scheduler.start()
+# Scheduled jobs run in the background worker (python se_worker.py), the web
+# workers only show the status of the elected one
+scheduler_leader = LeaderElection("scheduler", on_elected=None)
 
 # Init Flask-admin
 admin = Admin(app, index_view=SeAdminIndexView(), template_mode="bootstrap4")
@@ -462,6 +453,10 @@ admin.add_view(
     )
 )
 admin.add_view(SeAdminModelViewCurrentThesis(CurrentThesis, db.session))
+admin.add_view(SeAdminMetricsView(name="Metrics", endpoint="metrics"))
+admin.add_view(
+    SeAdminSchedulerView(scheduler_leader, name="Scheduler", endpoint="scheduler")
+)
 
 # Init SimpleMDE
 app.config["SIMPLEMDE_JS_IIFE"] = True
@@ -477,18 +472,7 @@ def datetime_convert(value, format="%d.%m.%Y %H:%M"):
 # Flask routes goes
 @app.route("/")
 def index():
-    ages = []
-    news = (
-        Posts.query.filter(Posts.type_id > 0)
-        .order_by(Posts.rank.desc())
-        .limit(10)
-        .all()
-    )
-
-    for post in news:
-        ages.append(plural_hours(int(get_hours_since(post.created_on))))
-
-    return render_template("index.html", news=news, ages=ages)
+    return render_template("index.html", news_block=news_block.get())
 
 
 @app.route("/index.html")
@@ -678,6 +662,11 @@ def sitemap():
     skip_pages = [
         "/nooffer",
         "/fetch_theses",
+        "/news/fetch_news",
+        "/diplomas/fetch_themes_facets",
+        "/internships/fetch_internships_facets",
+        "/news/atom.xml",
+        "/theses/atom.xml",
         "/Sitemap.xml",
         "/sitemap.xml",
         "/404.html",
@@ -714,5 +703,13 @@ if __name__ == "__main__":
         elif sys.argv[1] == "init":
             with app.app_context():
                 init_db()
+        elif sys.argv[1] == "generate":
+            # python flask_se.py generate [users] [seed]
+            from se_synthetic import generate_synthetic_data
+
+            users = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+            seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+            with app.app_context():
+                generate_synthetic_data(users, seed)
     else:
         app.run(port=5000, debug=True)
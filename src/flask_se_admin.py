@@ -1,13 +1,24 @@
 # -*- coding: utf-8 -*-
 
-from flask import redirect, url_for, session, render_template
-from flask_admin import AdminIndexView, expose
+import hmac
+
+from flask import (
+    redirect,
+    url_for,
+    session,
+    render_template,
+    request,
+    Response,
+    jsonify,
+)
+from flask_admin import AdminIndexView, BaseView, expose
 from flask_admin.contrib.sqla import ModelView
 from flask_admin.contrib.sqla.fields import QuerySelectField
 from flask_login import current_user
 from wtforms import TextAreaField, SelectField
 
-from flask_se_config import SECRET_KEY_THESIS
+from flask_se_config import SECRET_KEY_THESIS, METRICS_TOKEN
+from se_metrics import metrics
 from se_models import (
     db,
     Users,
@@ -334,6 +345,7 @@ class SeAdminModelViewReviewDiplomaThemes(SeAdminModelViewReviewer):
                     title=model.title,
                     comment=model.comment,
                 ),
+                urgent=True,
             )
         if previous_status != model.status and model.status == 1:
             add_mail_notification(
@@ -344,6 +356,7 @@ class SeAdminModelViewReviewDiplomaThemes(SeAdminModelViewReviewer):
                     title=model.title,
                     comment=model.comment,
                 ),
+                urgent=True,
             )
 
     def get_query(self):
@@ -375,3 +388,42 @@ class SeAdminModelViewCurrentThesis(SeAdminModelView):
         status="Статус",
     )
     column_choices = {"status": [(1, "Текущая работа"), (2, "Завершенная работа")]}
+
+
+class SeAdminMonitoringView(BaseView):
+    # Available to admins and to monitoring with the metrics bearer token
+    def is_accessible(self):
+        if METRICS_TOKEN:
+            authorization = request.headers.get("Authorization", "")
+            if hmac.compare_digest(authorization, "Bearer " + METRICS_TOKEN):
+                return True
+
+        if current_user.is_authenticated:
+            if current_user.role >= ADMIN_ROLE_LEVEL:
+                return True
+        else:
+            return False
+
+    def inaccessible_callback(self, name, **kwargs):
+        return redirect(url_for("login_index"))
+
+
+class SeAdminMetricsView(SeAdminMonitoringView):
+    @expose("/")
+    def index(self):
+        # ?scope=worker shows only the process which serves the request
+        aggregate = request.args.get("scope", default="all", type=str) != "worker"
+        return Response(
+            metrics.render(aggregate=aggregate),
+            mimetype="text/plain; version=0.0.4",
+        )
+
+
+class SeAdminSchedulerView(SeAdminMonitoringView):
+    def __init__(self, leader, *args, **kwargs):
+        self.leader = leader
+        super().__init__(*args, **kwargs)
+
+    @expose("/")
+    def index(self):
+        return jsonify(self.leader.status())
@@ -24,8 +24,9 @@ from pip._vendor import cachecontrol
 from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.security import generate_password_hash, check_password_hash
 
-from flask_se_config import secure_filename
+from flask_se_config import secure_filename, MAIL_DIGEST_WINDOW_MINUTES
 from se_models import db, Users
+from se_identity import identities
 
 # Global variables
 UPLOAD_FOLDER = "static/images/avatars/"
@@ -50,7 +51,7 @@ client_secrets_file = os.path.join(pathlib.Path(__file__).parent, "client_google
 
 @login_manager.user_loader
 def load_user(user_id):
-    return Users.query.get(int(user_id))
+    return identities.get(int(user_id))
 
 
 @login_manager.unauthorized_handler
@@ -230,9 +231,12 @@ def user_profile():
             user.middle_name = middle_name
             user.last_name = last_name
             user.how_to_contact = how_to_contact
+            user.mail_digest = request.form.get("mail_digest") is not None
             db.session.commit()
 
-    return render_template("auth/profile.html", user=user)
+    return render_template(
+        "auth/profile.html", user=user, mail_digest_window=MAIL_DIGEST_WINDOW_MINUTES
+    )
 
 
 @login_required
@@ -10,6 +10,9 @@ SECRET_KEY = os.path.join(pathlib.Path(__file__).parent, "configs/flask_se_secre
 MAIL_PASSWORD_FILE = os.path.join(
     pathlib.Path(__file__).parent, "configs/flask_se_mail.conf"
 )
+METRICS_TOKEN_FILE = os.path.join(
+    pathlib.Path(__file__).parent, "configs/flask_se_metrics.conf"
+)
 SECRET_KEY_THESIS = os.urandom(16).hex()
 SQLITE_DATABASE_NAME = "se.db"
 SQLITE_DATABASE_PATH = pathlib.Path("databases/").absolute().as_posix()
@@ -21,6 +24,16 @@ else:
     print("There is no MAIL_PASSWORD_FILE, generate random MAIL_PASSWORD")
     MAIL_PASSWORD = os.urandom(16).hex()
 
+# Users with mail_digest get non-urgent notifications at most once per window
+MAIL_DIGEST_WINDOW_MINUTES = 30
+
+# Bearer token for Prometheus, without it metrics are available to admins only
+if os.path.exists(METRICS_TOKEN_FILE):
+    with open(METRICS_TOKEN_FILE, "r") as file:
+        METRICS_TOKEN = file.read().rstrip()
+else:
+    METRICS_TOKEN = None
+
 
 current_data = datetime.today().strftime("%Y-%m-%d")
 SQLITE_DATABASE_BACKUP_NAME = "se_backup_" + current_data + ".db"
@@ -85,7 +98,9 @@ def secure_filename(filename: str) -> str:
 
 # https://felx.me/2021/08/29/improving-the-hacker-news-ranking-algorithm.html
 def post_ranking_score(upvotes=1, age=0, views=1):
-    u = upvotes**0.8
+    # Posts voted down score 0, a negative base would give a complex number.
+    # Works on numbers and NumPy arrays alike.
+    u = ((upvotes > 0) * upvotes) ** 0.8
     a = (age + 2) ** 1.8
     return (u / a) / (views + 1)
 
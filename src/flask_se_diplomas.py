@@ -1,66 +1,50 @@
 # -*- coding: utf-8 -*-
 
+import re
 import markdown
 
-from flask import flash, redirect, request, render_template, url_for
+from flask import flash, jsonify, redirect, request, render_template, url_for
 from flask_login import current_user
+from sqlalchemy import literal_column
+from sqlalchemy.orm import joinedload, selectinload
+from whoosh.lang.snowball.russian import RussianStemmer
 
 from flask_se_auth import login_required
 from se_forms import UserAddTheme, UserEditTheme, DiplomaThemesFilter
-from se_models import db, DiplomaThemes, ThemesLevel, Company, Staff, Users
+from se_models import (
+    db,
+    DiplomaThemes,
+    ThemesLevel,
+    Company,
+    Staff,
+    Users,
+    diploma_themes_fts,
+)
+from se_filters import themes_facets, themes_filter_choices
+from se_pagination import KeysetPage, paginate
+from se_reference import reference
+
+russian_stemmer = RussianStemmer()
+
+# Everything fetch_themes.html shows of a theme
+THEMES_PAGE_OPTIONS = (
+    selectinload(DiplomaThemes.levels),
+    joinedload(DiplomaThemes.company),
+    joinedload(DiplomaThemes.author),
+    joinedload(DiplomaThemes.supervisor),
+    joinedload(DiplomaThemes.supervisor_thesis),
+    joinedload(DiplomaThemes.consultant),
+)
 
 
 def diplomas_index():
     diploma_filter = DiplomaThemesFilter()
-
-    # themes = DiplomaThemes.query.filter_by(status=2).all()
     user_themes_count = 0
 
-    for sid in (
-        DiplomaThemes.query.with_entities(DiplomaThemes.company_id)
-        .filter_by(status=2)
-        .distinct()
-        .all()
-    ):
-        company = Company.query.filter_by(id=sid[0]).first()
-        diploma_filter.company.choices.append((sid[0], company.name))
-        diploma_filter.company.choices.sort(key=lambda tup: tup[1])
-
-    for sid in (
-        DiplomaThemes.query.with_entities(DiplomaThemes.supervisor_id)
-        .filter_by(status=2)
-        .distinct()
-        .all()
-    ):
-        if sid[0] is None:
-            continue
-
-        user = Users.query.filter_by(id=sid[0]).first()
-        last_name = ""
-        initials = ""
-
-        if not user:
-            user = Users.query.filter_by(id=1).first()
-
-        if user.last_name:
-            last_name = user.last_name
-
-        if user.first_name:
-            initials = initials + user.first_name[0] + "."
-
-        if user.middle_name:
-            initials = initials + user.middle_name[0] + "."
-
-        diploma_filter.supervisor.choices.append((sid[0], last_name + " " + initials))
-        diploma_filter.supervisor.choices.sort(key=lambda tup: tup[1])
-
-    for sid in ThemesLevel.query.all():
-        diploma_filter.level.choices.append((sid.id, sid.level))
-        diploma_filter.level.choices.sort(key=lambda tup: tup[1])
-
-    diploma_filter.supervisor.choices.insert(0, (0, "Все"))
-    diploma_filter.level.choices.insert(0, (0, "Все"))
-    diploma_filter.company.choices.insert(0, (0, "Все"))
+    choices = themes_filter_choices.get()
+    diploma_filter.company.choices = [(0, "Все")] + choices["company"]
+    diploma_filter.supervisor.choices = [(0, "Все")] + choices["supervisor"]
+    diploma_filter.level.choices = [(0, "Все")] + choices["level"]
 
     if current_user.is_authenticated:
         user = current_user
@@ -73,42 +57,85 @@ def diplomas_index():
     )
 
 
+def themes_match(search):
+    """FTS5 query matching all the words of search, None without words.
+
+    Words are cut to their stems by the Russian Snowball stemmer and matched
+    as prefixes, so "компиляторы" finds "компилятор" and "компиляторов".
+    Latin words like "ML" are kept as they are."""
+    words = [russian_stemmer.stem(word) for word in re.findall(r"\w+", search.lower())]
+    if not words:
+        return None
+    return " ".join('"%s"*' % word for word in words)
+
+
+def search_themes(records, search, cursor=None, per_page=10):
+    """Themes of records matching search, best first. The bm25 relevance
+    weighs the title most."""
+    fts = literal_column("diploma_themes_fts")
+    score = (-db.func.bm25(fts, 10.0, 2.0, 1.0, type_=db.Float)).label("score")
+
+    # Only ids and scores go through the sort
+    hits = records.with_entities(DiplomaThemes.id, score).join(
+        diploma_themes_fts, diploma_themes_fts.c.rowid == DiplomaThemes.id
+    )
+    match = themes_match(search)
+    if match:
+        hits = hits.filter(fts.op("MATCH")(match))
+    else:
+        hits = hits.filter(db.false())
+
+    themes = KeysetPage(
+        hits,
+        (score, DiplomaThemes.id),
+        cursor,
+        per_page,
+        values=lambda hit: (hit.score, hit.id),
+    )
+    found = {
+        theme.id: theme
+        for theme in DiplomaThemes.query.options(*THEMES_PAGE_OPTIONS).filter(
+            DiplomaThemes.id.in_([hit.id for hit in themes.items])
+        )
+    }
+    themes.items = [found[hit.id] for hit in themes.items if hit.id in found]
+    return themes
+
+
 def fetch_themes():
     level = request.args.get("level", default=0, type=int)
-    page = request.args.get("page", default=1, type=int)
     supervisor = request.args.get("supervisor", default=0, type=int)
     company = request.args.get("company", default=0, type=int)
+    search = request.args.get("search", default="", type=str).strip()
+
+    records = DiplomaThemes.query.filter(DiplomaThemes.status == 2)
 
     if company:
-        # Check if company exists
-        records = (
-            DiplomaThemes.query.filter(DiplomaThemes.status == 2)
-            .filter(DiplomaThemes.company_id == company)
-            .order_by(DiplomaThemes.id.desc())
-        )
-    else:
-        records = DiplomaThemes.query.filter(DiplomaThemes.status == 2).order_by(
-            DiplomaThemes.id.desc()
-        )
+        records = records.filter(DiplomaThemes.company_id == company)
 
     if supervisor:
         # Check if supervisor exists
-        ids = (
-            DiplomaThemes.query.with_entities(DiplomaThemes.supervisor_id)
-            .distinct()
-            .all()
-        )
-        if [item for item in ids if item[0] == supervisor]:
+        exists = db.session.query(
+            DiplomaThemes.query.filter(
+                DiplomaThemes.supervisor_id == supervisor
+            ).exists()
+        ).scalar()
+        if exists:
             records = records.filter(DiplomaThemes.supervisor_id == supervisor)
         else:
             supervisor = 0
 
     if level:
-        records = records.filter(DiplomaThemes.levels.any(id=level)).paginate(
-            per_page=10, page=page, error_out=False
-        )
+        records = records.filter(DiplomaThemes.levels.any(id=level))
+
+    if search:
+        records = search_themes(records, search, request.args.get("cursor"))
     else:
-        records = records.paginate(per_page=10, page=page, error_out=False)
+        records = paginate(
+            records.options(*THEMES_PAGE_OPTIONS).order_by(DiplomaThemes.id.desc()),
+            (DiplomaThemes.id,),
+            per_page=10,
+        )
 
     if len(records.items):
         return render_template(
@@ -117,16 +144,46 @@ def fetch_themes():
             level=level,
             company=company,
             supervisor=supervisor,
+            search=search,
         )
     else:
         return render_template("diplomas/fetch_themes_blank.html")
 
 
+def fetch_themes_facets():
+    selected = {
+        facet: request.args.get(facet, default=0, type=int)
+        for facet in themes_facets.facets
+    }
+    search = request.args.get("search", default="", type=str).strip()
+    ids = None
+    match = themes_match(search)
+    if match:
+        fts = literal_column("diploma_themes_fts")
+        ids = {
+            row.rowid
+            for row in db.session.query(diploma_themes_fts.c.rowid).filter(
+                fts.op("MATCH")(match)
+            )
+        }
+    elif search:
+        ids = ()
+    return jsonify(themes_facets.counts(selected, ids))
+
+
 @login_required
 def user_diplomas_index():
     user = current_user
     themes = (
         DiplomaThemes.query.filter_by(author_id=user.id)
+        .options(
+            selectinload(DiplomaThemes.levels),
+            joinedload(DiplomaThemes.company),
+            joinedload(DiplomaThemes.author),
+            joinedload(DiplomaThemes.supervisor),
+            joinedload(DiplomaThemes.supervisor_thesis),
+            joinedload(DiplomaThemes.consultant),
+        )
         .order_by(DiplomaThemes.id.desc())
         .all()
     )
@@ -153,11 +210,9 @@ def get_theme():
 def add_user_theme():
     user = current_user
     add_theme = UserAddTheme()
-    add_theme.levels.choices = [
-        (g.id, g.level) for g in ThemesLevel.query.order_by("id").all()
-    ]
+    add_theme.levels.choices = reference.choices(ThemesLevel)
     add_theme.company.choices = [
-        (g.id, g.name) for g in Company.query.filter_by(status=0).order_by("id")
+        (g.id, g.name) for g in reference.all(Company) if g.status == 0
     ]
 
     if request.method == "POST":
@@ -167,8 +222,6 @@ def add_user_theme():
         levels = request.form.getlist("levels", type=int)
         company = request.form.get("company", type=int)
 
-        level_accepted = []
-
         if not title:
             flash("Заголовок у темы является обязательным полем.")
             return render_template("diplomas/add_theme.html", form=add_theme, user=user)
@@ -185,18 +238,13 @@ def add_user_theme():
             flash("Необходимо указать, от кого предлагается тема.")
             return render_template("diplomas/add_theme.html", form=add_theme, user=user)
 
-        themes_level = ThemesLevel.query.all()
-        company_count = Company.query.count()
-
-        for tl in themes_level:
-            if tl.id in levels:
-                level_accepted.append(tl)
+        level_accepted = ThemesLevel.query.filter(ThemesLevel.id.in_(levels)).all()
 
         if not level_accepted:
             flash("Уровень темы указан неверно")
             return render_template("diplomas/add_theme.html", form=add_theme, user=user)
 
-        if company < 1 or company > company_count:
+        if reference.get(Company, company) is None:
             flash("Уровень темы указан неверно")
             return render_template("diplomas/add_theme.html", form=add_theme, user=user)
 
@@ -250,10 +298,8 @@ def edit_user_theme():
         return redirect(url_for("diplomas_index"))
 
     edit_theme = UserEditTheme()
-    edit_theme.levels.choices = [
-        (g.id, g.level) for g in ThemesLevel.query.order_by("id")
-    ]
-    edit_theme.company.choices = [(g.id, g.name) for g in Company.query.order_by("id")]
+    edit_theme.levels.choices = reference.choices(ThemesLevel)
+    edit_theme.company.choices = reference.choices(Company)
     edit_theme.levels.data = [c.id for c in theme.levels]
     edit_theme.company.data = str(theme.company_id)
     edit_theme.comment.data = theme.comment
@@ -271,7 +317,6 @@ def edit_user_theme():
         requirements = request.form.get("requirements", type=str)
         levels = request.form.getlist("levels", type=int)
         company = request.form.get("company", type=int)
-        level_accepted = []
 
         if not title:
             flash("Заголовок у темы является обязательным полем.")
@@ -297,12 +342,7 @@ def edit_user_theme():
                 "diplomas/edit_theme.html", form=edit_theme, user=user
             )
 
-        themes_level = ThemesLevel.query.all()
-        company_count = Company.query.count()
-
-        for tl in themes_level:
-            if tl.id in levels:
-                level_accepted.append(tl)
+        level_accepted = ThemesLevel.query.filter(ThemesLevel.id.in_(levels)).all()
 
         if not level_accepted:
             flash("Уровень темы указан неверно")
@@ -310,7 +350,7 @@ def edit_user_theme():
                 "diplomas/add_theme.html", form=edit_theme, user=user
             )
 
-        if company < 1 or company > company_count:
+        if reference.get(Company, company) is None:
             flash("Уровень темы указан неверно")
             return render_template(
                 "diplomas/edit_theme.html", form=edit_theme, user=user
@@ -3,11 +3,13 @@
 import markdown
 import os.path
 
-from flask import flash, redirect, request, render_template, url_for
+from flask import flash, jsonify, redirect, request, render_template, url_for
 from flask_login import current_user
+from sqlalchemy.orm import joinedload, selectinload
 
 from flask_se_auth import login_required
 from se_forms import AddInternship, InternshipsFilter
+from se_reference import reference
 from se_models import (
     db,
     Internships,
@@ -15,6 +17,8 @@ from se_models import (
     InternshipCompany,
     InternshipTag,
 )
+from se_filters import internships_facets
+from se_pagination import paginate
 
 
 def internships_index():
@@ -26,18 +30,18 @@ def internships_index():
         internship_filter.company.choices.append((x[0], company.name))
         internship_filter.company.choices.sort(key=lambda tup: tup[1])
 
-    for sid in InternshipFormat.query.all():
-        internship_filter.format.choices.append((sid.id, sid.format))
+    internship_filter.format.choices.extend(reference.choices(InternshipFormat))
+
+    internships = Internships.query.options(selectinload(Internships.tag)).all()
 
     internship_filter.tag.choices = sorted(
-        list({(y.id, y.tag) for x in Internships.query.all() for y in x.tag}),
+        list({(y.id, y.tag) for x in internships for y in x.tag}),
         key=lambda x: x[1],
     )
     internship_filter.tag.choices.insert(0, (0, "Все"))
     internship_filter.format.choices.insert(0, (0, "Все"))
     internship_filter.company.choices.insert(0, (0, "Все"))
 
-    internships = Internships.query.all()
     return render_template(
         "internships/internships_index.html",
         internships=internships,
@@ -54,12 +58,10 @@ def old_internships_index():
 def add_internship():
     user = current_user
     add_intern = AddInternship()
-    add_intern.format.choices = [
-        (g.id, g.format) for g in InternshipFormat.query.order_by("id").all()
-    ]
-    add_intern.tag.choices = [
-        (t.id, t.tag) for t in InternshipTag.query.order_by("tag").all()
-    ]
+    add_intern.format.choices = reference.choices(InternshipFormat)
+    add_intern.tag.choices = sorted(
+        reference.choices(InternshipTag), key=lambda tup: tup[1]
+    )
     add_intern.company.choices = [
         g.name for g in InternshipCompany.query.order_by("id")
     ]
@@ -199,12 +201,8 @@ def update_internship(id):
         return redirect(url_for("internships_index"))
     upd_internship = AddInternship(obj=internship)
 
-    upd_internship.format.choices = [
-        (g.id, g.format) for g in InternshipFormat.query.order_by("id").all()
-    ]
-    upd_internship.tag.choices = [
-        (t.id, t.tag) for t in InternshipTag.query.order_by("id").all()
-    ]
+    upd_internship.format.choices = reference.choices(InternshipFormat)
+    upd_internship.tag.choices = reference.choices(InternshipTag)
     upd_internship.tag.data = "".join([t.tag + ", " for t in internship.tag]).strip(
         ", "
     )
@@ -323,7 +321,6 @@ def fetch_internships():
     user = current_user
 
     format = request.args.get("format", default=0, type=int)
-    page = request.args.get("page", default=1, type=int)
     company = request.args.get("company", default=0, type=int)
     tag = request.args.get("tag", default=0, type=int)
 
@@ -340,7 +337,11 @@ def fetch_internships():
     if tag:
         records = records.filter(Internships.tag.any(id=tag))
 
-    records = records.paginate(per_page=10, page=page, error_out=False)
+    records = paginate(
+        records.options(joinedload(Internships.company), selectinload(Internships.tag)),
+        (Internships.id,),
+        per_page=10,
+    )
 
     if len(records.items):
         return render_template(
@@ -353,3 +354,11 @@ def fetch_internships():
         )
     else:
         return render_template("internships/fetch_internships_blank.html")
+
+
+def fetch_internships_facets():
+    selected = {
+        facet: request.args.get(facet, default=0, type=int)
+        for facet in internships_facets.facets
+    }
+    return jsonify(internships_facets.counts(selected))
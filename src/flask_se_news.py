@@ -1,28 +1,88 @@
 # -*- coding: utf-8 -*-
 
+import re
 import textile
 from urllib.parse import urlparse
 
-from flask import flash, redirect, request, render_template, url_for
+from flask import abort, flash, redirect, request, render_template, url_for
 from flask_login import current_user
+from sqlalchemy import literal_column
+from sqlalchemy.orm import joinedload
 
-from flask_se_config import post_ranking_score, get_hours_since, plural_hours
+from flask_se_config import get_hours_since, plural_hours
 from flask_se_auth import login_required
-from se_models import db, Posts, PostVote
+from se_models import (
+    db,
+    Posts,
+    posts_fts,
+    vote_for_post,
+    NEWS_SEARCH_RANK_BOOST,
+)
+from se_pagination import KeysetPage, paginate
+from se_view_counter import view_counter
+
+
+def search_posts(search, cursor=None, per_page=20):
+    """Posts matching all the words of search (as prefixes), best first. The
+    bm25 relevance, the title weighing most, is boosted up to twice by the
+    rank, so of two equally relevant posts the one ranked higher comes first."""
+    words = re.findall(r"\w+", search.lower())
+    fts = literal_column("posts_fts")
+    relevance = -db.func.bm25(fts, 10.0, 1.0, 2.0, type_=db.Float)
+    score = (
+        relevance * (1 + Posts.rank / (Posts.rank + NEWS_SEARCH_RANK_BOOST))
+    ).label("score")
+
+    # Every match is scored, so only ids go through the sort
+    hits = db.session.query(Posts.id, score).join(
+        posts_fts, posts_fts.c.rowid == Posts.id
+    )
+    if words:
+        hits = hits.filter(fts.op("MATCH")(" ".join('"%s"*' % w for w in words)))
+    else:
+        hits = hits.filter(db.false())
+
+    news = KeysetPage(
+        hits,
+        (score, Posts.id),
+        cursor,
+        per_page,
+        values=lambda hit: (hit.score, hit.id),
+    )
+    posts = {
+        post.id: post
+        for post in Posts.query.options(
+            joinedload(Posts.type), joinedload(Posts.author)
+        ).filter(Posts.id.in_([hit.id for hit in news.items]))
+    }
+    news.items = [posts[hit.id] for hit in news.items if hit.id in posts]
+    return news
+
+
+def get_news():
+    search = request.args.get("search", default="", type=str).strip()
+    if search:
+        news = search_posts(search, request.args.get("cursor"), per_page=20)
+    else:
+        news = paginate(
+            Posts.query.options(
+                joinedload(Posts.type), joinedload(Posts.author)
+            ).order_by(Posts.rank.desc()),
+            (Posts.rank, Posts.id),
+            per_page=20,
+        )
+    ages = [plural_hours(int(get_hours_since(post.created_on))) for post in news.items]
+    return news, ages, search
 
 
 def list_news():
-    page = request.args.get("page", default=1, type=int)
-    ages = []
-
-    news = Posts.query.order_by(Posts.rank.desc()).paginate(
-        per_page=20, page=page, error_out=False
-    )
+    news, ages, search = get_news()
+    return render_template("news/news.html", news=news, ages=ages, search=search)
 
-    for post in news.items:
-        ages.append(plural_hours(int(get_hours_since(post.created_on))))
 
-    return render_template("news/news.html", news=news, ages=ages)
+def fetch_news():
+    news, ages, search = get_news()
+    return render_template("news/fetch_news.html", news=news, ages=ages, search=search)
 
 
 def get_post():
@@ -33,12 +93,8 @@ def get_post():
 
     post = Posts.query.filter_by(id=post_id).first_or_404()
 
-    post.views = post.views + 1
-
-    # Recalculate rank
-    age = get_hours_since(post.created_on)
-    post.rank = post_ranking_score(post.votes, age, post.views)
-    db.session.commit()
+    # Written in batches together with the new rank, see se_view_counter
+    view_counter.add(post.id)
 
     if post.uri:
         return redirect(post.uri)
@@ -54,46 +110,22 @@ def post_vote():
     if not post_id:
         return render_template(url_for("index"))
 
+    # 1 is an upvote, 0 a downvote, anything else must not change the votes
+    if action_vote not in (0, 1):
+        abort(400)
+
     post = Posts.query.filter_by(id=post_id).first_or_404()
 
     if post.author.id == current_user.id:
         flash("Нельзя голосовать за свой пост!", category="error")
         return redirect(request.referrer)
 
-    vote = PostVote.query.filter_by(user=current_user, post=post).first()
-
-    if vote:
-        if vote.upvote != bool(int(action_vote)):
-            vote.upvote = bool(int(action_vote))
-
-            if action_vote:
-                post.votes = post.votes + 1
-            else:
-                post.votes = post.votes - 1
-
-            # Recalculate rank
-            age = get_hours_since(post.created_on)
-            post.rank = post_ranking_score(post.votes, age, post.views)
-            db.session.commit()
-
-            return redirect(request.referrer)
-        else:
-            flash("Вы уже проголосовали за этот пост!", category="error")
-            return redirect(request.referrer)
-
-    vote = PostVote(user=current_user, post=post, upvote=bool(int(action_vote)))
-
-    if action_vote:
-        post.votes = post.votes + 1
-    else:
-        post.votes = post.votes - 1
-
-    # Recalculate rank
-    age = get_hours_since(post.created_on)
-    post.rank = post_ranking_score(post.votes, age, post.views)
+    if not vote_for_post(current_user.id, post.id, action_vote == 1):
+        flash("Вы уже проголосовали за этот пост!", category="error")
+        return redirect(request.referrer)
 
-    db.session.add(vote)
-    db.session.commit()
+    # Recalculated in the next batch with the post views
+    view_counter.refresh_rank(post.id)
     return redirect(request.referrer)
 
 
@@ -33,6 +33,7 @@ from datetime import datetime
 from flask_se_auth import login_required
 
 from se_forms import ChooseTopic, UserAddReport, CurrentWorktypeArea
+from se_reference import reference
 from se_models import (
     Users,
     AreasOfStudy,
@@ -145,11 +146,9 @@ def practice_new_thesis():
 
     form = CurrentWorktypeArea()
     form.area.choices.append((0, "Выберите направление"))
-    for area in AreasOfStudy.query.filter(AreasOfStudy.id > 1).order_by("id").all():
-        form.area.choices.append((area.id, area.area))
+    form.area.choices.extend(reference.choices(AreasOfStudy, first_id=2))
     form.worktype.choices.append((0, "Выберите тип работы"))
-    for worktype in Worktype.query.filter(Worktype.id > 2).all():
-        form.worktype.choices.append((worktype.id, worktype.type))
+    form.worktype.choices.extend(reference.choices(Worktype, first_id=3))
 
     return render_template(
         PracticeStudentTemplates.NEW_PRACTICE.value,
@@ -747,21 +746,25 @@ def practice_data_for_practice(current_thesis):
             return redirect(url_for("practice_index"))
 
     form = CurrentWorktypeArea()
-    form.area.choices.append((current_thesis.area_id, current_thesis.area.area))
-    for area in (
-        AreasOfStudy.query.filter(AreasOfStudy.id > 1)
-        .filter(AreasOfStudy.id != current_thesis.area.id)
-        .order_by("id")
-        .all()
-    ):
-        form.area.choices.append((area.id, area.area))
+    form.area.choices.append(
+        (
+            current_thesis.area_id,
+            str(reference.get(AreasOfStudy, current_thesis.area_id)),
+        )
+    )
+    for area in reference.all(AreasOfStudy, first_id=2):
+        if area.id != current_thesis.area_id:
+            form.area.choices.append((area.id, area.area))
 
     form.worktype.choices.append(
-        (current_thesis.worktype_id, current_thesis.worktype.type)
+        (
+            current_thesis.worktype_id,
+            str(reference.get(Worktype, current_thesis.worktype_id)),
+        )
     )
-    for worktype in Worktype.query.filter(Worktype.id > 2).all():
+    for worktype in reference.all(Worktype, first_id=3):
         if worktype.id != current_thesis.worktype_id:
-            form.worktype.choices.append((worktype.id, worktype))
+            form.worktype.choices.append((worktype.id, worktype.type))
 
     return render_template(
         PracticeStudentTemplates.SETTINGS.value,
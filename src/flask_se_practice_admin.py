@@ -22,11 +22,13 @@ import tempfile
 
 from flask import flash, redirect, request, render_template, url_for, send_file, session
 from flask_login import current_user
+from sqlalchemy.orm import joinedload
 from zipfile import ZipFile
 from transliterate import translit
 
 from flask_se_auth import login_required
 from se_forms import ChooseCourseAndYear
+from se_reference import reference
 from se_models import (
     AreasOfStudy,
     CurrentThesis,
@@ -34,6 +36,7 @@ from se_models import (
     NotificationPractice,
     db,
     add_mail_notification,
+    add_mail_notifications,
     Staff,
     Courses,
     Thesis,
@@ -91,8 +94,7 @@ def __get_filename_without_extension(worktype: Worktype, area: AreasOfStudy) ->
 def user_is_staff(func):
     @wraps(func)
     def check_user_is_staff_decorator(*args, **kwargs):
-        user_staff = Staff.query.filter_by(user_id=current_user.id).first()
-        if not user_staff:
+        if not current_user.is_staff:
             return redirect(url_for("practice_index"))
         return func(*args, **kwargs)
 
@@ -123,8 +125,8 @@ def choose_area_and_worktype_admin():
 def index_admin():
     area_id = request.args.get("area_id", type=int)
     worktype_id = request.args.get("worktype_id", type=int)
-    area = AreasOfStudy.query.filter_by(id=area_id).first()
-    worktype = Worktype.query.filter_by(id=worktype_id).first()
+    area = reference.get(AreasOfStudy, area_id)
+    worktype = reference.get(Worktype, worktype_id)
 
     if request.method == "POST":
         if "download_materials_button" in request.form:
@@ -142,6 +144,47 @@ def index_admin():
                 thesis.status = 2
             db.session.commit()
 
+        if "submit_cohort_notification_button" in request.form:
+            content = request.form.get("cohort_content", "").strip()
+            if not content:
+                flash("Нельзя отправить пустое уведомление!", category="error")
+                return redirect(
+                    url_for("index_admin", area_id=area.id, worktype_id=worktype.id)
+                )
+
+            authors = (
+                db.session.query(CurrentThesis.author_id)
+                .filter_by(area_id=area_id)
+                .filter_by(worktype_id=worktype_id)
+                .filter_by(deleted=False)
+                .filter_by(status=1)
+                .distinct()
+            )
+            notified = add_mail_notifications(
+                [author.author_id for author in authors],
+                "[SE site] Уведомление от руководителя практики",
+                NotificationTemplates.NOTIFICATION_FROM_CURATOR_TO_COHORT.value,
+                context={
+                    "curator": current_user,
+                    "area": area,
+                    "worktype": worktype,
+                    "content": content,
+                },
+                practice_content=(
+                    f"Руководитель практики {current_user.get_name()} "
+                    f'отправил уведомление студентам направления "{area}" '
+                    f"({worktype}): {content}"
+                ),
+                urgent=True,
+            )
+            flash(
+                f"Уведомление отправлено студентам: {len(notified)}",
+                category="success",
+            )
+            return redirect(
+                url_for("index_admin", area_id=area.id, worktype_id=worktype.id)
+            )
+
         if "download_table" in request.form:
             filename = __get_filename_without_extension(worktype, area) + ".xlsx"
             with tempfile.TemporaryDirectory() as tmp:
@@ -207,16 +250,18 @@ def index_admin():
                     url_for("index_admin", area_id=area.id, worktype_id=worktype.id)
                 )
 
-    list_of_areas = (
-        AreasOfStudy.query.filter(AreasOfStudy.id > 1).order_by(AreasOfStudy.id).all()
-    )
-    list_of_work_types = Worktype.query.filter(Worktype.id > 2).all()
+    list_of_areas = reference.all(AreasOfStudy, first_id=2)
+    list_of_work_types = reference.all(Worktype, first_id=3)
     list_of_thesises = (
         CurrentThesis.query.filter_by(area_id=area_id)
         .filter_by(worktype_id=worktype_id)
         .filter_by(deleted=False)
         .filter_by(status=1)
         .filter(CurrentThesis.title != None)
+        .options(
+            joinedload(CurrentThesis.user),
+            joinedload(CurrentThesis.supervisor).joinedload(Staff.user),
+        )
         .all()
     )
     table_name = __get_filename_without_extension(worktype, area) + ".xlsx"
@@ -289,28 +334,22 @@ def thesis_admin():
                 flash("Нельзя отправить пустое уведомление!", category="error")
                 return redirect(url_for("thesis_staff", id=current_thesis.id))
 
-            mail_notification = render_template(
-                NotificationTemplates.NOTIFICATION_FROM_CURATOR.value,
-                curator=current_user,
-                thesis=current_thesis,
-                content=request.form["content"],
-            )
-            add_mail_notification(
-                current_thesis.author_id,
+            add_mail_notifications(
+                [current_thesis.author_id],
                 "[SE site] Уведомление от руководителя практики",
-                mail_notification,
-            )
-
-            notification_content = (
-                f"Руководитель практики {current_user.get_name()} "
-                f'отправил Вам уведомление по работе "{current_thesis.title}": '
-                f"{request.form['content']}"
-            )
-            notification = NotificationPractice(
-                recipient_id=current_thesis.author_id, content=notification_content
+                NotificationTemplates.NOTIFICATION_FROM_CURATOR.value,
+                context={
+                    "curator": current_user,
+                    "thesis": current_thesis,
+                    "content": request.form["content"],
+                },
+                practice_content=(
+                    f"Руководитель практики {current_user.get_name()} "
+                    f'отправил Вам уведомление по работе "{current_thesis.title}": '
+                    f"{request.form['content']}"
+                ),
+                urgent=True,
             )
-            db.session.add(notification)
-            db.session.commit()
             flash("Уведомление отправлено!", category="success")
         elif "submit_edit_title_button" in request.form:
             new_title = request.form["title_input"]
@@ -336,16 +375,14 @@ def thesis_admin():
             current_thesis.status = 1
             db.session.commit()
 
-    list_of_areas = (
-        AreasOfStudy.query.filter(AreasOfStudy.id > 1).order_by(AreasOfStudy.id).all()
-    )
-    list_of_work_types = Worktype.query.filter(Worktype.id > 2).all()
+    list_of_areas = reference.all(AreasOfStudy, first_id=2)
+    list_of_work_types = reference.all(Worktype, first_id=3)
     not_deleted_tasks = [task for task in current_thesis.tasks if not task.deleted]
     session["previous_page"] = PracticeAdminPage.THESIS.value
     return render_template(
         PracticeAdminTemplates.THESIS.value,
-        area=current_thesis.area,
-        worktype=current_thesis.worktype,
+        area=reference.get(AreasOfStudy, current_thesis.area_id),
+        worktype=reference.get(Worktype, current_thesis.worktype_id),
         list_of_areas=list_of_areas,
         list_of_worktypes=list_of_work_types,
         thesis=current_thesis,
@@ -508,20 +545,17 @@ def archive_thesis():
             flash("Работа перенесена в архив!", category="success")
             return redirect(url_for("thesis_admin", id=current_thesis.id))
 
-    list_of_areas = (
-        AreasOfStudy.query.filter(AreasOfStudy.id > 1).order_by(AreasOfStudy.id).all()
-    )
-    list_of_work_types = Worktype.query.filter(Worktype.id > 2).all()
+    list_of_areas = reference.all(AreasOfStudy, first_id=2)
+    list_of_work_types = reference.all(Worktype, first_id=3)
     course_and_year_form = ChooseCourseAndYear()
     course_and_year_form.course.choices.append((0, "Выберите направление"))
-    for course in Courses.query.all():
-        course_and_year_form.course.choices.append((course.id, course.name))
+    course_and_year_form.course.choices.extend(reference.choices(Courses))
 
     return render_template(
         PracticeAdminTemplates.ARCHIVE_THESIS.value,
         thesis=current_thesis,
-        area=current_thesis.area,
-        worktype=current_thesis.worktype,
+        area=reference.get(AreasOfStudy, current_thesis.area_id),
+        worktype=reference.get(Worktype, current_thesis.worktype_id),
         list_of_areas=list_of_areas,
         list_of_worktypes=list_of_work_types,
         form=course_and_year_form,
@@ -533,8 +567,8 @@ def archive_thesis():
 def finished_thesises_admin():
     area_id = request.args.get("area_id", type=int)
     worktype_id = request.args.get("worktype_id", type=int)
-    area = AreasOfStudy.query.filter_by(id=area_id).first()
-    worktype = Worktype.query.filter_by(id=worktype_id).first()
+    area = reference.get(AreasOfStudy, area_id)
+    worktype = reference.get(Worktype, worktype_id)
 
     current_thesises = (
         CurrentThesis.query.filter_by(area_id=area_id)
@@ -542,13 +576,15 @@ def finished_thesises_admin():
         .filter_by(status=2)
         .filter_by(deleted=False)
         .filter(CurrentThesis.title != None)
+        .options(
+            joinedload(CurrentThesis.user),
+            joinedload(CurrentThesis.supervisor).joinedload(Staff.user),
+        )
         .all()
     )
 
-    list_of_areas = (
-        AreasOfStudy.query.filter(AreasOfStudy.id > 1).order_by(AreasOfStudy.id).all()
-    )
-    list_of_work_types = Worktype.query.filter(Worktype.id > 2).all()
+    list_of_areas = reference.all(AreasOfStudy, first_id=2)
+    list_of_work_types = reference.all(Worktype, first_id=3)
     session["previous_page"] = PracticeAdminPage.FINISHED_THESISES.value
     return render_template(
         PracticeAdminTemplates.FINISHED_THESISES.value,
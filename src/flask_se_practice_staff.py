@@ -21,6 +21,7 @@ import pytz
 from dateutil import tz
 from flask import flash, redirect, request, render_template, url_for
 from sqlalchemy import desc
+from sqlalchemy.orm import joinedload, selectinload
 from functools import wraps
 
 from flask_se_auth import login_required
@@ -29,11 +30,11 @@ from flask_login import current_user
 from se_forms import StaffAddCommentToReport
 from se_models import (
     db,
-    Staff,
     CurrentThesis,
     ThesisReport,
     NotificationPractice,
     add_mail_notification,
+    add_mail_notifications,
 )
 
 from templates.practice.staff.templates import PracticeStaffTemplates
@@ -53,40 +54,46 @@ def datetime_convert(value):
 def user_is_staff(func):
     @wraps(func)
     def check_user_is_staff_decorator():
-        user_staff = Staff.query.filter_by(user_id=current_user.id).first()
-        if not user_staff:
+        if not current_user.is_staff:
             return redirect(url_for("practice_index"))
-        return func(user_staff)
+        return func(current_user.staff_id)
 
     return check_user_is_staff_decorator
 
 
 def current_thesis_exists_or_redirect(func):
     @wraps(func)
-    def get_current_thesis_decorator(user_staff):
+    def get_current_thesis_decorator(staff_id):
         current_thesis_id = request.args.get("id", type=int)
         if not current_thesis_id:
             return redirect(url_for("index_staff"))
         current_thesis = (
-            CurrentThesis.query.filter_by(supervisor_id=user_staff.id)
+            CurrentThesis.query.filter_by(supervisor_id=staff_id)
             .filter_by(id=current_thesis_id)
             .first()
         )
         if not current_thesis:
             return redirect(url_for("index_staff"))
-        return func(user_staff, current_thesis)
+        return func(staff_id, current_thesis)
 
     return get_current_thesis_decorator
 
 
 @login_required
 @user_is_staff
-def index_staff(user_staff):
+def index_staff(staff_id):
     current_thesises = (
-        CurrentThesis.query.filter_by(supervisor_id=user_staff.id)
+        CurrentThesis.query.filter_by(supervisor_id=staff_id)
         .filter_by(status=1)
         .filter_by(deleted=False)
         .outerjoin(ThesisReport, CurrentThesis.reports)
+        .options(
+            joinedload(CurrentThesis.user),
+            joinedload(CurrentThesis.worktype),
+            joinedload(CurrentThesis.area),
+            selectinload(CurrentThesis.reports),
+            selectinload(CurrentThesis.tasks),
+        )
         .order_by(desc(ThesisReport.time))
         .all()
     )
@@ -97,11 +104,16 @@ def index_staff(user_staff):
 
 @login_required
 @user_is_staff
-def finished_thesises_staff(user_staff):
+def finished_thesises_staff(staff_id):
     current_thesises = (
-        CurrentThesis.query.filter_by(supervisor_id=user_staff.id)
+        CurrentThesis.query.filter_by(supervisor_id=staff_id)
         .filter_by(status=2)
         .filter_by(deleted=False)
+        .options(
+            joinedload(CurrentThesis.user),
+            joinedload(CurrentThesis.worktype),
+            joinedload(CurrentThesis.area),
+        )
         .all()
     )
     return render_template(
@@ -112,34 +124,29 @@ def finished_thesises_staff(user_staff):
 @login_required
 @user_is_staff
 @current_thesis_exists_or_redirect
-def thesis_staff(user_staff, current_thesis):
+def thesis_staff(staff_id, current_thesis):
     if request.method == "POST":
         if "submit_notification_button" in request.form:
             if request.form["content"] in {None, ""}:
                 flash("Нельзя отправить пустое уведомление!", category="error")
                 return redirect(url_for("thesis_staff", id=current_thesis.id))
 
-            mail_notification = render_template(
-                NotificationTemplates.NOTIFICATION_FROM_SUPERVISOR.value,
-                supervisor=user_staff,
-                thesis=current_thesis,
-                content=request.form["content"],
-            )
-            add_mail_notification(
-                current_thesis.author_id,
+            add_mail_notifications(
+                [current_thesis.author_id],
                 "[SE site] Уведомление от научного руководителя",
-                mail_notification,
-            )
-            notification_content = (
-                f"Научный руководитель {user_staff.user.get_name()} "
-                f'отправил Вам уведомление по работе "{current_thesis.title}": '
-                f"{request.form['content']}"
-            )
-            notification = NotificationPractice(
-                recipient_id=current_thesis.author_id, content=notification_content
+                NotificationTemplates.NOTIFICATION_FROM_SUPERVISOR.value,
+                context={
+                    "supervisor": current_thesis.supervisor,
+                    "thesis": current_thesis,
+                    "content": request.form["content"],
+                },
+                practice_content=(
+                    f"Научный руководитель {current_user.get_name()} "
+                    f'отправил Вам уведомление по работе "{current_thesis.title}": '
+                    f"{request.form['content']}"
+                ),
+                urgent=True,
             )
-            db.session.add(notification)
-            db.session.commit()
             flash("Уведомление отправлено!", category="success")
         elif "submit_finish_work_button" in request.form:
             current_thesis.status = 2
@@ -159,7 +166,7 @@ def thesis_staff(user_staff, current_thesis):
 @login_required
 @user_is_staff
 @current_thesis_exists_or_redirect
-def reports_staff(user_staff, current_thesis):
+def reports_staff(staff_id, current_thesis):
     current_report_id = request.args.get("report_id", type=int)
     reports = (
         ThesisReport.query.filter_by(current_thesis_id=current_thesis.id)
@@ -175,7 +182,7 @@ def reports_staff(user_staff, current_thesis):
         if not current_report or current_report.deleted:
             return redirect(url_for("index_staff"))
 
-        if current_report.practice.supervisor_id != user_staff.id:
+        if current_report.practice.supervisor_id != staff_id:
             return redirect(url_for("index_staff"))
 
         if request.method == "POST":
@@ -190,7 +197,7 @@ def reports_staff(user_staff, current_thesis):
                     db.session.commit()
 
                     content = (
-                        f"Научный руководитель {user_staff.user.get_name()} прокомментировал "
+                        f"Научный руководитель {current_user.get_name()} прокомментировал "
                         + f"Ваш отчет от {datetime_convert(current_report.time)} "
                         + f'по работе "{current_thesis.title}"'
                     )
@@ -204,7 +211,7 @@ def reports_staff(user_staff, current_thesis):
                         "[SE site] Отчёт прокомментирован",
                         render_template(
                             NotificationTemplates.SUPERVISOR_COMMENT_TO_REPORT.value,
-                            user_staff=user_staff,
+                            user_staff=current_thesis.supervisor,
                             current_report=current_report,
                             current_thesis=current_thesis,
                         ),
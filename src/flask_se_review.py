@@ -4,14 +4,16 @@ import os
 from datetime import date
 from pathlib import Path
 
-from flask import flash, redirect, request, render_template, url_for
+from flask import abort, flash, redirect, request, render_template, url_for
 from flask_login import current_user
+from sqlalchemy.orm import joinedload
 from transliterate import translit
 
 from flask_se_config import secure_filename, get_thesis_type_id_string
 from flask_se_auth import login_required
 from se_forms import AddThesisOnReview, ThesisReviewFilter, EditThesisOnReview
 from se_review_forms import ReviewForm
+from se_reference import reference
 from se_models import (
     db,
     Thesis,
@@ -25,6 +27,7 @@ from se_models import (
     PromoCode,
     add_mail_notification,
 )
+from se_pagination import paginate
 
 
 # Global variables
@@ -50,14 +53,10 @@ def thesis_review_index():
         (0, "Работа зачтена"),
     ]
 
-    for type in ThesisOnReviewWorktype.query.distinct().all():
-        form.worktype.choices.append((type.id, type.type))
-
+    form.worktype.choices.extend(reference.choices(ThesisOnReviewWorktype))
     form.worktype.choices.sort(key=lambda tup: tup[0])
 
-    for area in AreasOfStudy.query.distinct().all():
-        form.areasofstudy.choices.append((area.id, area.area))
-
+    form.areasofstudy.choices.extend(reference.choices(AreasOfStudy))
     form.areasofstudy.choices.sort(key=lambda tup: tup[0])
 
     thesis = ThesisOnReview.query.all()
@@ -70,7 +69,6 @@ def fetch_thesis_on_review():
     user = current_user
 
     status = request.args.get("status", default=4, type=int)
-    page = request.args.get("page", default=1, type=int)
     worktype = request.args.get("worktype", default=1, type=int)
     area = request.args.get("area", default=1, type=int)
 
@@ -90,12 +88,16 @@ def fetch_thesis_on_review():
     if worktype > 1:
         records = records.filter(ThesisOnReview.thesis_on_review_type_id == worktype)
 
+    records = records.options(
+        joinedload(ThesisOnReview.author),
+        joinedload(ThesisOnReview.area),
+        joinedload(ThesisOnReview.reviewer),
+    )
+
     if area > 1:
-        records = records.filter(ThesisOnReview.area_id == area).paginate(
-            per_page=20, page=page, error_out=False
-        )
-    else:
-        records = records.paginate(per_page=20, page=page, error_out=False)
+        records = records.filter(ThesisOnReview.area_id == area)
+
+    records = paginate(records, (ThesisOnReview.id,), per_page=20)
 
     return render_template(
         "thesis_review/fetch_thesis_on_review.html",
@@ -122,11 +124,11 @@ def submit_thesis_on_review():
             flash("Укажите название вашей работы", "error")
             return redirect(request.url)
 
-        if worktype <= 0 or worktype > ThesisOnReviewWorktype.query.distinct().count():
+        if worktype <= 0 or reference.get(ThesisOnReviewWorktype, worktype) is None:
             flash("Укажите тип работы", "error")
             return redirect(request.url)
 
-        if area_of_study <= 0 or area_of_study > AreasOfStudy.query.distinct().count():
+        if area_of_study <= 0 or reference.get(AreasOfStudy, area_of_study) is None:
             flash("Укажите направление вашего обучения", "error")
             return redirect(request.url)
 
@@ -193,18 +195,10 @@ def submit_thesis_on_review():
     form.type.choices.append((0, "Тип работы"))
     form.area.choices.append((0, "Направление обучения"))
 
-    for type in (
-        ThesisOnReviewWorktype.query.filter(ThesisOnReviewWorktype.id > 1)
-        .distinct()
-        .all()
-    ):
-        form.type.choices.append((type.id, type.type))
-
+    form.type.choices.extend(reference.choices(ThesisOnReviewWorktype, first_id=2))
     form.type.choices.sort(key=lambda tup: tup[0])
 
-    for area in AreasOfStudy.query.filter(AreasOfStudy.id > 1).distinct().all():
-        form.area.choices.append((area.id, area.area))
-
+    form.area.choices.extend(reference.choices(AreasOfStudy, first_id=2))
     form.area.choices.sort(key=lambda tup: tup[0])
 
     return render_template("thesis_review/submit.html", filter=form, user=user)
@@ -235,11 +229,11 @@ def edit_thesis_on_review():
         title = title.strip()
         author = thesis_review.author.get_name()
 
-        if worktype <= 0 or worktype > ThesisOnReviewWorktype.query.distinct().count():
+        if worktype <= 0 or reference.get(ThesisOnReviewWorktype, worktype) is None:
             flash("Укажите тип работы", "error")
             return redirect(request.url)
 
-        if area <= 0 or area > AreasOfStudy.query.distinct().count():
+        if area <= 0 or reference.get(AreasOfStudy, area) is None:
             flash("Укажите направление вашего обучения", "error")
             return redirect(request.url)
 
@@ -296,16 +290,10 @@ def edit_thesis_on_review():
         return redirect(url_for("thesis_review_index"))
 
     edit_thesis_onreview = EditThesisOnReview()
-    edit_thesis_onreview.type.choices = [
-        (g.id, g.type)
-        for g in ThesisOnReviewWorktype.query.filter(
-            ThesisOnReviewWorktype.id > 1
-        ).order_by("id")
-    ]
-    edit_thesis_onreview.area.choices = [
-        (g.id, g.area)
-        for g in AreasOfStudy.query.filter(AreasOfStudy.id > 1).order_by("id")
-    ]
+    edit_thesis_onreview.type.choices = reference.choices(
+        ThesisOnReviewWorktype, first_id=2
+    )
+    edit_thesis_onreview.area.choices = reference.choices(AreasOfStudy, first_id=2)
 
     edit_thesis_onreview.type.default = int(thesis_review.thesis_on_review_type_id)
     edit_thesis_onreview.area.default = int(thesis_review.area_id)
@@ -347,13 +335,11 @@ def delete_thesis_on_review():
 @login_required
 def review_thesis_on_review():
     user = current_user
-    user_reviewer = Reviewer.query.filter_by(user_id=user.id).first_or_404()
+    if not user.is_reviewer:
+        abort(404)
     thesis_id = request.args.get("thesis_review_id", type=int)
     set_to_review = request.args.get("set_to_review", type=int, default=0)
 
-    if not user_reviewer:
-        return redirect(url_for("thesis_review_index"))
-
     if not thesis_id:
         return redirect(url_for("thesis_review_index"))
 
@@ -374,12 +360,15 @@ def review_thesis_on_review():
     # Set reviewer_id to user.id
     if (thesis.review_status == 1) and (set_to_review != 0):
         thesis.review_status = 2
-        thesis.reviewer_id = user_reviewer.id
+        thesis.reviewer_id = user.reviewer_id
         db.session.commit()
 
         data = render_template("notification/thesis_on_review_get.html", thesis=thesis)
         add_mail_notification(
-            thesis.author_id, "[SE site] Ваша работа на рецензировании", data
+            thesis.author_id,
+            "[SE site] Ваша работа на рецензировании",
+            data,
+            urgent=True,
         )
 
     review_form = ReviewForm()
@@ -391,14 +380,15 @@ def review_thesis_on_review():
 @login_required
 def review_submit_review():
     user = current_user
-    user_reviewer = Reviewer.query.filter_by(user_id=user.id).first_or_404()
+    if not user.is_reviewer:
+        abort(404)
     thesis_id = request.args.get("thesis_review_id", type=int)
 
     if request.method != "POST":
         flash("Неверный метод, разрешается только метод POST", "error")
         return redirect(url_for("thesis_review_index"))
 
-    if not user_reviewer:
+    if not user.is_reviewer:
         flash("Вы не состоите в группе рецензентов", "error")
         return redirect(url_for("thesis_review_index"))
 
@@ -513,7 +503,9 @@ def review_submit_review():
     db.session.add(review)
     db.session.commit()
 
-    add_mail_notification(thesis.author_id, "[SE site] Результат рецензирования", data)
+    add_mail_notification(
+        thesis.author_id, "[SE site] Результат рецензирования", data, urgent=True
+    )
 
     return redirect(url_for("thesis_review_index"))
 
@@ -575,9 +567,7 @@ def review_become_thesis_reviewer_ask():
     if not promo:
         return redirect(url_for("index"))
 
-    reviewer = Reviewer.query.filter_by(user_id=user.id).first()
-
-    if reviewer:
+    if user.is_reviewer:
         return render_template("thesis_review/already_reviewer.html", user=user)
 
     return render_template(
@@ -596,9 +586,7 @@ def review_become_thesis_reviewer_confirm():
     if not promo:
         return redirect(url_for("index"))
 
-    reviewer = Reviewer.query.filter_by(user_id=user.id).first()
-
-    if reviewer:
+    if user.is_reviewer:
         return render_template("thesis_review/already_reviewer.html", user=user)
 
     r = Reviewer(user_id=user.id)
@@ -10,11 +10,13 @@ from os.path import splitext
 from urllib.parse import urlparse
 
 from flask import render_template, request, jsonify, redirect, url_for
+from sqlalchemy.orm import joinedload, selectinload
 from transliterate import translit
 
 from flask_se_config import SECRET_KEY_THESIS
 from se_forms import ThesisFilter
 from se_models import db, Staff, Users, Thesis, Worktype, Courses
+from se_pagination import paginate
 
 log = logging.getLogger("flask_se.sub")
 
@@ -80,7 +82,6 @@ def theses_search():
 
 def fetch_theses():
     worktype = request.args.get("worktype", default=1, type=int)
-    page = request.args.get("page", default=1, type=int)
     supervisor = request.args.get("supervisor", default=0, type=int)
     course = request.args.get("course", default=0, type=int)
     search = request.args.get("search", default="", type=str)
@@ -133,12 +134,16 @@ def fetch_theses():
         else:
             supervisor = 0
 
+    records = records.options(
+        joinedload(Thesis.supervisor).joinedload(Staff.user),
+        joinedload(Thesis.course),
+        selectinload(Thesis.tags),
+    )
+
     if worktype > 1:
-        records = records.filter_by(type_id=worktype).paginate(
-            per_page=10, page=page, error_out=False
-        )
-    else:
-        records = records.paginate(per_page=10, page=page, error_out=False)
+        records = records.filter_by(type_id=worktype)
+
+    records = paginate(records, (Thesis.publish_year, Thesis.id), per_page=10)
 
     if len(records.items):
         first_priority = []
@@ -0,0 +1,43 @@
+"""post vote ledger
+
+Revision ID: 8519906a801a
+Revises: aa3624c327cb
+Create Date: 2026-10-18 23:43:09.234717
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8519906a801a'
+down_revision = 'aa3624c327cb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # A vote without a post can't be a part of the (user_id, post_id) key
+    op.execute("DELETE FROM post_vote WHERE post_id IS NULL")
+
+    with op.batch_alter_table('post_vote', schema=None) as batch_op:
+        batch_op.alter_column('post_id',
+               existing_type=sa.INTEGER(),
+               nullable=False)
+        batch_op.drop_constraint('pk_post_vote', type_='primary')
+        batch_op.create_primary_key('pk_post_vote', ['user_id', 'post_id'])
+
+
+def downgrade():
+    # Only the latest vote of every user fits the old key
+    op.execute(
+        "DELETE FROM post_vote WHERE rowid NOT IN "
+        "(SELECT max(rowid) FROM post_vote GROUP BY user_id)"
+    )
+
+    with op.batch_alter_table('post_vote', schema=None) as batch_op:
+        batch_op.drop_constraint('pk_post_vote', type_='primary')
+        batch_op.create_primary_key('pk_post_vote', ['user_id'])
+        batch_op.alter_column('post_id',
+               existing_type=sa.INTEGER(),
+               nullable=True)
@@ -0,0 +1,52 @@
+"""news full-text index
+
+Revision ID: 88c5a09ffa60
+Revises: 8519906a801a
+Create Date: 2026-10-19 00:04:53.928861
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '88c5a09ffa60'
+down_revision = '8519906a801a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # External content FTS5 index of the news, the triggers keep it in sync
+    op.execute(
+        "CREATE VIRTUAL TABLE posts_fts USING fts5("
+        "title, text, domain, content='posts', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')"
+    )
+    op.execute(
+        "CREATE TRIGGER posts_fts_insert AFTER INSERT ON posts BEGIN "
+        "INSERT INTO posts_fts(rowid, title, text, domain) "
+        "VALUES (new.id, new.title, new.text, new.domain); END"
+    )
+    op.execute(
+        "CREATE TRIGGER posts_fts_delete AFTER DELETE ON posts BEGIN "
+        "INSERT INTO posts_fts(posts_fts, rowid, title, text, domain) "
+        "VALUES ('delete', old.id, old.title, old.text, old.domain); END"
+    )
+    op.execute(
+        "CREATE TRIGGER posts_fts_update "
+        "AFTER UPDATE OF title, text, domain ON posts BEGIN "
+        "INSERT INTO posts_fts(posts_fts, rowid, title, text, domain) "
+        "VALUES ('delete', old.id, old.title, old.text, old.domain); "
+        "INSERT INTO posts_fts(rowid, title, text, domain) "
+        "VALUES (new.id, new.title, new.text, new.domain); END"
+    )
+    # Index the existing posts
+    op.execute("INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS posts_fts_update")
+    op.execute("DROP TRIGGER IF EXISTS posts_fts_delete")
+    op.execute("DROP TRIGGER IF EXISTS posts_fts_insert")
+    op.execute("DROP TABLE IF EXISTS posts_fts")
@@ -0,0 +1,65 @@
+"""diploma themes full-text index
+
+Revision ID: bb6226212bae
+Revises: 868b2ce69c97
+Create Date: 2026-10-19 00:18:17.290411
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bb6226212bae'
+down_revision = '868b2ce69c97'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Contentless FTS5 index of the approved themes, the triggers keep it in
+    # sync with the status
+    op.execute(
+        "CREATE VIRTUAL TABLE diploma_themes_fts USING fts5("
+        "title, description, requirements, content='', "
+        "tokenize='unicode61 remove_diacritics 2')"
+    )
+    op.execute(
+        "CREATE TRIGGER diploma_themes_fts_insert "
+        "AFTER INSERT ON diploma_themes WHEN new.status = 2 BEGIN "
+        "INSERT INTO diploma_themes_fts(rowid, title, description, requirements) "
+        "VALUES (new.id, new.title, new.description, new.requirements); END"
+    )
+    op.execute(
+        "CREATE TRIGGER diploma_themes_fts_delete "
+        "AFTER DELETE ON diploma_themes WHEN old.status = 2 BEGIN "
+        "INSERT INTO diploma_themes_fts"
+        "(diploma_themes_fts, rowid, title, description, requirements) "
+        "VALUES ('delete', old.id, old.title, old.description, old.requirements); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER diploma_themes_fts_update "
+        "AFTER UPDATE OF title, description, requirements, status ON diploma_themes "
+        "BEGIN "
+        "INSERT INTO diploma_themes_fts"
+        "(diploma_themes_fts, rowid, title, description, requirements) "
+        "SELECT 'delete', old.id, old.title, old.description, old.requirements "
+        "WHERE old.status = 2; "
+        "INSERT INTO diploma_themes_fts(rowid, title, description, requirements) "
+        "SELECT new.id, new.title, new.description, new.requirements "
+        "WHERE new.status = 2; END"
+    )
+    # Index the approved themes
+    op.execute(
+        "INSERT INTO diploma_themes_fts(rowid, title, description, requirements) "
+        "SELECT id, title, description, requirements FROM diploma_themes "
+        "WHERE status = 2"
+    )
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS diploma_themes_fts_update")
+    op.execute("DROP TRIGGER IF EXISTS diploma_themes_fts_delete")
+    op.execute("DROP TRIGGER IF EXISTS diploma_themes_fts_insert")
+    op.execute("DROP TABLE IF EXISTS diploma_themes_fts")
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import time
+
+from flask_se_config import SQLITE_DATABASE_PATH
+
+CACHE_DIR = os.path.join(SQLITE_DATABASE_PATH, "cache")
+
+
+class SharedVersion:
+    """Version counter shared by all processes (uWSGI workers, background
+    worker) through a small file in the databases directory. A process that
+    changes cached data bumps the version, other processes notice the new
+    value within check_interval seconds and drop their copies."""
+
+    def __init__(self, name, check_interval=1.0):
+        self.filename = os.path.join(CACHE_DIR, name + ".version")
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._value = None
+        self._checked_at = 0.0
+
+    def _read(self):
+        try:
+            with open(self.filename, "r") as file:
+                return int(file.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def current(self):
+        now = time.monotonic()
+        if self._value is None or now - self._checked_at >= self.check_interval:
+            self._value = self._read()
+            self._checked_at = now
+        return self._value
+
+    def bump(self):
+        with self._lock:
+            # Nanoseconds keep the version growing even if the file is lost
+            value = max(self._read() + 1, time.time_ns())
+            try:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                tmp_filename = "%s.%d.tmp" % (self.filename, os.getpid())
+                with open(tmp_filename, "w") as file:
+                    file.write(str(value))
+                os.replace(tmp_filename, self.filename)
+            except OSError:
+                pass
+            self._value = value
+            self._checked_at = time.monotonic()
+            return value
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import make_response, render_template, request, url_for
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload
+
+from se_cache import CACHE_DIR, SharedVersion
+from se_models import db, Posts, Thesis, Staff
+
+# Feed ids and links point to the public site whatever host served the feed,
+# as in sitemap.xml
+FEED_SITE_URL = "https://se.math.spbu.ru"
+FEED_SIZE = 30
+
+
+class Feed:
+    """Atom feed of the latest rows of a model, newest id first.
+
+    Every request checks SELECT max(id), a lookup in the primary key, and
+    the shared version, which a commit changing or deleting rows of the model
+    bumps. Rows added since the last check are fetched by id > last max id
+    and put in front of the cached entries, a changed version reloads the
+    latest FEED_SIZE rows. Both read the table by primary key and nothing is
+    rendered while the entries stay the same.
+
+    ETag is a hash of the entries and Last-Modified the time the entries
+    were first seen this way by any process. The time is kept in
+    databases/cache/<name>.feed, so all processes answer pollers with the
+    same validators and most polls end with 304 Not Modified."""
+
+    def __init__(self, name, title, page, model, query, entry):
+        self.name = name
+        self.title = title
+        self.page = page
+        self.model = model
+        self.query = query
+        self.entry = entry
+        self.version = SharedVersion(name)
+        self.stamp_filename = os.path.join(CACHE_DIR, name + ".feed")
+        self._lock = threading.Lock()
+        self._version = None
+        self._max_id = None
+        self._entries = []
+        self._feed = None
+
+    def _latest(self, after_id=None):
+        query = self.query()
+        if after_id is not None:
+            query = query.filter(self.model.id > after_id)
+        return [
+            self.entry(row)
+            for row in query.order_by(self.model.id.desc()).limit(FEED_SIZE)
+        ]
+
+    def _stamp(self, etag):
+        """Time the entries with this etag appeared, the same in all processes."""
+        try:
+            with open(self.stamp_filename, "r") as file:
+                stamp_etag, stamp = file.read().split()
+            if stamp_etag == etag:
+                return datetime.fromtimestamp(int(stamp), timezone.utc)
+        except (OSError, ValueError):
+            pass
+
+        stamp = int(time.time())
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp_filename = "%s.%d.tmp" % (self.stamp_filename, os.getpid())
+            with open(tmp_filename, "w") as file:
+                file.write("%s %d" % (etag, stamp))
+            os.replace(tmp_filename, self.stamp_filename)
+        except OSError:
+            pass
+        return datetime.fromtimestamp(stamp, timezone.utc)
+
+    def _render(self, entries):
+        etag = hashlib.sha1(repr(entries).encode()).hexdigest()
+        updated = self._stamp(etag)
+        xml = render_template(
+            "feeds/atom.xml",
+            title=self.title,
+            self_uri=FEED_SITE_URL + request.path,
+            page_uri=FEED_SITE_URL + url_for(self.page),
+            updated=atom_date(updated),
+            entries=entries,
+        )
+        return xml.encode("utf-8"), etag, updated
+
+    def get(self):
+        version = self.version.current()
+        max_id = db.session.query(db.func.max(self.model.id)).scalar() or 0
+
+        with self._lock:
+            if version == self._version and max_id == self._max_id:
+                feed = self._feed
+            else:
+                feed = None
+            cached_version, cached_max_id = self._version, self._max_id
+            entries = self._entries
+
+        if feed is None:
+            if version == cached_version and max_id > (cached_max_id or 0):
+                entries = (self._latest(cached_max_id) + entries)[:FEED_SIZE]
+            else:
+                entries = self._latest()
+            feed = self._render(entries)
+            with self._lock:
+                self._version = version
+                self._max_id = max_id
+                self._entries = entries
+                self._feed = feed
+
+        xml, etag, updated = feed
+        response = make_response(xml)
+        response.headers["Content-Type"] = "application/atom+xml; charset=utf-8"
+        response.set_etag(etag)
+        response.last_modified = updated
+        response.cache_control.public = True
+        response.cache_control.max_age = 300
+        return response.make_conditional(request)
+
+
+def atom_date(value):
+    return value.replace(tzinfo=None).isoformat(timespec="seconds") + "Z"
+
+
+def post_entry(post):
+    updated = post.updated_on or post.created_on
+    return {
+        "id": "%s/news/item.html?post=%d" % (FEED_SITE_URL, post.id),
+        "title": post.title,
+        "link": post.uri or FEED_SITE_URL + url_for("get_post", post=post.id),
+        "updated": atom_date(updated),
+        "published": atom_date(post.created_on),
+        "author": post.author.get_name(),
+        "summary": post.text,
+    }
+
+
+def thesis_entry(thesis):
+    if thesis.text_uri:
+        link = FEED_SITE_URL + url_for("download_thesis", thesis_id=thesis.id)
+    else:
+        link = FEED_SITE_URL + url_for("theses_search", search=thesis.name_ru)
+
+    summary = "Автор: %s. Год: %d." % (thesis.author, thesis.publish_year)
+    if thesis.supervisor:
+        summary += " Руководитель: %s." % thesis.supervisor.user.get_name()
+    if thesis.description:
+        summary += "\n\n" + thesis.description
+
+    # Theses keep the year of the defence only
+    published = atom_date(datetime(thesis.publish_year, 1, 1))
+    return {
+        "id": "%s/theses/%d" % (FEED_SITE_URL, thesis.id),
+        "title": thesis.name_ru,
+        "link": link,
+        "updated": published,
+        "published": published,
+        "author": thesis.author,
+        "summary": summary,
+    }
+
+
+news_feed = Feed(
+    "news_feed",
+    "Новости кафедры системного программирования СПбГУ",
+    "list_news",
+    Posts,
+    lambda: Posts.query.options(joinedload(Posts.author)),
+    post_entry,
+)
+
+theses_feed = Feed(
+    "theses_feed",
+    "Выпускные работы кафедры системного программирования СПбГУ",
+    "theses_search",
+    Thesis,
+    lambda: Thesis.query.filter(Thesis.temporary == False).options(
+        joinedload(Thesis.supervisor).joinedload(Staff.user)
+    ),
+    thesis_entry,
+)
+
+FEED_MODELS = {Posts: news_feed, Thesis: theses_feed}
+
+
+# New rows are found by max(id), only changes and deletions bump the version
+@event.listens_for(Session, "after_flush")
+def _feeds_after_flush(session, flush_context):
+    for instance in (*session.dirty, *session.deleted):
+        feed = FEED_MODELS.get(type(instance))
+        if feed is not None:
+            session.info.setdefault("se_feeds_changed", set()).add(feed)
+
+
+@event.listens_for(Session, "after_commit")
+def _feeds_after_commit(session):
+    for feed in session.info.pop("se_feeds_changed", ()):
+        feed.version.bump()
+
+
+@event.listens_for(Session, "after_rollback")
+def _feeds_after_rollback(session):
+    session.info.pop("se_feeds_changed", None)
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from se_cache import SharedVersion
+from se_models import (
+    db,
+    Company,
+    DiplomaThemes,
+    Internships,
+    ThemesLevel,
+    Users,
+    diploma_themes_level,
+    internships_format,
+    internships_tag,
+)
+from se_reference import reference
+
+
+def short_name(last_name, first_name, middle_name):
+    """Last name and initials: "Терехов А.Н."."""
+    initials = ""
+    if first_name:
+        initials = initials + first_name[0] + "."
+    if middle_name:
+        initials = initials + middle_name[0] + "."
+    return (last_name or "") + " " + initials
+
+
+def bit_count(mask):
+    return bin(mask).count("1")
+
+
+class FacetIndex:
+    """Bitmap index of a small set of rows by the values of a few facets.
+
+    Every row gets a bit and every facet value a mask of the rows having it,
+    so the counts of all the options of a filter given the other selected
+    filters are a few ANDs of Python ints, with no queries. The index is
+    rebuilt from load() when the shared version changes.
+
+    load() returns a dict of row ids to dicts of facet name to a list of
+    values."""
+
+    def __init__(self, version, facets, load):
+        self.version = version
+        self.facets = facets
+        self.load = load
+        self._lock = threading.Lock()
+        self._loaded_version = None
+        self._masks = None
+        self._bits = None
+
+    def _build(self):
+        rows = self.load()
+        masks = {facet: {} for facet in self.facets}
+        bits = {}
+        for bit, (row_id, row) in enumerate(rows.items()):
+            bits[row_id] = 1 << bit
+            for facet in self.facets:
+                for value in row[facet]:
+                    if value is not None:
+                        masks[facet][value] = masks[facet].get(value, 0) | 1 << bit
+        return masks, bits
+
+    def _index(self):
+        version = self.version.current()
+        with self._lock:
+            if version == self._loaded_version:
+                return self._masks, self._bits
+
+        masks, bits = self._build()
+        with self._lock:
+            self._masks, self._bits = masks, bits
+            self._loaded_version = version
+        return masks, bits
+
+    def counts(self, selected, ids=None):
+        """Number of rows for every option of every facet, given the values
+        selected in the other facets; 0 stands for "all" as in the filters.
+        ids limits the rows, e.g. to the ones found by a search.
+
+        {"company": {0: 12, 1: 7, 2: 5}, ...}"""
+        masks, bits = self._index()
+        if ids is None:
+            all_rows = (1 << len(bits)) - 1
+        else:
+            all_rows = 0
+            for row_id in ids:
+                all_rows |= bits.get(row_id, 0)
+
+        counts = {}
+        for facet in self.facets:
+            rows = all_rows
+            for other in self.facets:
+                value = selected.get(other)
+                if other != facet and value:
+                    rows &= masks[other].get(value, 0)
+
+            counts[facet] = {
+                value: bit_count(mask & rows) for value, mask in masks[facet].items()
+            }
+            counts[facet][0] = bit_count(rows)
+        return counts
+
+
+def load_themes_facets():
+    themes = {
+        theme.id: {
+            "level": [],
+            "company": [theme.company_id],
+            "supervisor": [theme.supervisor_id],
+        }
+        for theme in db.session.query(
+            DiplomaThemes.id, DiplomaThemes.company_id, DiplomaThemes.supervisor_id
+        ).filter(DiplomaThemes.status == 2)
+    }
+    for theme_id, level_id in db.session.query(
+        diploma_themes_level.c.diploma_themes_id, diploma_themes_level.c.themes_level_id
+    ):
+        if theme_id in themes:
+            themes[theme_id]["level"].append(level_id)
+    return themes
+
+
+def load_internships_facets():
+    internships = {
+        internship.id: {"format": [], "company": [internship.company_id], "tag": []}
+        for internship in db.session.query(Internships.id, Internships.company_id)
+    }
+    for facet, secondary, column in (
+        ("format", internships_format, "internships_format_id"),
+        ("tag", internships_tag, "internships_tag_id"),
+    ):
+        for internship_id, value in db.session.query(
+            secondary.c.internships_id, secondary.c[column]
+        ):
+            if internship_id in internships:
+                internships[internship_id][facet].append(value)
+    return internships
+
+
+class ThemesFilterChoices:
+    """Choices of the diploma themes filter: the companies and supervisors of
+    the approved themes and all the levels, each sorted by label.
+
+    Built with two grouped queries and kept per process until the shared
+    version changes, i.e. until some process commits a change to a theme, a
+    company or a level, or renames a supervisor of an approved theme."""
+
+    def __init__(self):
+        self.version = SharedVersion("diploma_themes")
+        self._lock = threading.Lock()
+        self._loaded_version = None
+        self._choices = None
+
+    def _load(self):
+        companies = (
+            db.session.query(Company.id, Company.name)
+            .join(DiplomaThemes, DiplomaThemes.company_id == Company.id)
+            .filter(DiplomaThemes.status == 2)
+            .group_by(Company.id)
+            .order_by(Company.name)
+            .all()
+        )
+        supervisors = (
+            db.session.query(
+                Users.id, Users.last_name, Users.first_name, Users.middle_name
+            )
+            .join(DiplomaThemes, DiplomaThemes.supervisor_id == Users.id)
+            .filter(DiplomaThemes.status == 2)
+            .group_by(Users.id)
+            .all()
+        )
+        return {
+            "company": [(c.id, c.name) for c in companies],
+            "supervisor": sorted(
+                (
+                    (s.id, short_name(s.last_name, s.first_name, s.middle_name))
+                    for s in supervisors
+                ),
+                key=lambda choice: choice[1],
+            ),
+            "level": sorted(
+                reference.choices(ThemesLevel), key=lambda choice: choice[1]
+            ),
+        }
+
+    def get(self):
+        """{"company": [(id, label), ...], "supervisor": ..., "level": ...}"""
+        version = self.version.current()
+        with self._lock:
+            if version == self._loaded_version:
+                return self._choices
+
+        choices = self._load()
+        with self._lock:
+            self._choices = choices
+            self._loaded_version = version
+        return choices
+
+    def invalidate(self):
+        self.version.bump()
+
+
+themes_filter_choices = ThemesFilterChoices()
+
+# Approved themes by level, company and supervisor
+themes_facets = FacetIndex(
+    themes_filter_choices.version,
+    ("level", "company", "supervisor"),
+    load_themes_facets,
+)
+
+# Internships by format, company and tag
+internships_facets = FacetIndex(
+    SharedVersion("internships"), ("format", "company", "tag"), load_internships_facets
+)
+
+FILTER_VERSIONS = {
+    DiplomaThemes: themes_filter_choices.version,
+    Company: themes_filter_choices.version,
+    ThemesLevel: themes_filter_choices.version,
+    Internships: internships_facets.version,
+}
+
+SUPERVISOR_NAME_COLUMNS = ("last_name", "first_name", "middle_name")
+
+
+def _supervisor_changed(session, user):
+    """A supervisor of an approved theme was renamed or deleted. Other edits
+    of users, profiles, avatars and settings, keep the filters."""
+    if user not in session.deleted:
+        attrs = inspect(user).attrs
+        if not any(
+            attrs[name].history.has_changes() for name in SUPERVISOR_NAME_COLUMNS
+        ):
+            return False
+
+    theme = (
+        session.query(DiplomaThemes.id)
+        .filter(DiplomaThemes.supervisor_id == user.id, DiplomaThemes.status == 2)
+        .first()
+    )
+    return theme is not None
+
+
+# Approval, archiving and edits of themes, companies and levels, renamed
+# supervisors, internships
+@event.listens_for(Session, "after_flush")
+def _filters_after_flush(session, flush_context):
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        version = FILTER_VERSIONS.get(type(instance))
+        if version is None and isinstance(instance, Users):
+            if instance not in session.new and _supervisor_changed(session, instance):
+                version = themes_filter_choices.version
+        if version is not None:
+            session.info.setdefault("se_filters_changed", set()).add(version)
+
+
+@event.listens_for(Session, "after_commit")
+def _filters_after_commit(session):
+    for version in session.info.pop("se_filters_changed", ()):
+        version.bump()
+
+
+@event.listens_for(Session, "after_rollback")
+def _filters_after_rollback(session):
+    session.info.pop("se_filters_changed", None)
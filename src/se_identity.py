@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from se_cache import SharedVersion
+from se_models import db, Users, Staff, Reviewer
+
+# Seconds a worker trusts its copy of the user without looking at the database
+IDENTITY_TTL = 60
+IDENTITY_CACHE_SIZE = 10000
+
+
+class IdentitySnapshot(NamedTuple):
+    id: int
+    email: Optional[str]
+    first_name: str
+    middle_name: Optional[str]
+    last_name: Optional[str]
+    avatar_uri: str
+    role: int
+    staff_id: Optional[int]
+    reviewer_id: Optional[int]
+
+
+class UserIdentity(UserMixin):
+    """current_user for logged in users.
+
+    The fields of IdentitySnapshot are read from the per-worker cache, any
+    other attribute (relationships, rarely used columns) is taken from the
+    Users row, which is loaded on first access within the request."""
+
+    def __init__(self, snapshot):
+        self.__dict__["_snapshot"] = snapshot
+        self.__dict__["_row"] = None
+
+    def _user(self):
+        if self._row is None:
+            self.__dict__["_row"] = db.session.get(Users, self._snapshot.id)
+        return self._row
+
+    def __getattr__(self, name):
+        snapshot = self.__dict__["_snapshot"]
+        if name in IdentitySnapshot._fields:
+            return getattr(snapshot, name)
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._user(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._user(), name, value)
+
+    @property
+    def is_staff(self):
+        return self._snapshot.staff_id is not None
+
+    @property
+    def is_reviewer(self):
+        return self._snapshot.reviewer_id is not None
+
+    def get_id(self):
+        return str(self._snapshot.id)
+
+    def get_name(self):
+        return Users.get_name(self)
+
+    def __str__(self):
+        return Users.__str__(self)
+
+    def __repr__(self):
+        return Users.__repr__(self)
+
+
+class IdentityCache:
+    def __init__(self):
+        self.version = SharedVersion("identity")
+        self._lock = threading.Lock()
+        self._loaded_version = None
+        self._snapshots = {}
+
+    def _load(self, user_id):
+        user = db.session.get(Users, user_id)
+        if user is None:
+            return None
+
+        staff_id = (
+            db.session.query(Staff.id)
+            .filter(Staff.user_id == user_id)
+            .limit(1)
+            .scalar()
+        )
+        reviewer_id = (
+            db.session.query(Reviewer.id)
+            .filter(Reviewer.user_id == user_id)
+            .limit(1)
+            .scalar()
+        )
+        return IdentitySnapshot(
+            id=user.id,
+            email=user.email,
+            first_name=user.first_name,
+            middle_name=user.middle_name,
+            last_name=user.last_name,
+            avatar_uri=user.avatar_uri,
+            role=user.role,
+            staff_id=staff_id,
+            reviewer_id=reviewer_id,
+        )
+
+    def get(self, user_id):
+        version = self.version.current()
+        now = time.monotonic()
+        with self._lock:
+            if version != self._loaded_version:
+                self._snapshots = {}
+                self._loaded_version = version
+            cached = self._snapshots.get(user_id)
+        if cached is not None and cached[0] > now:
+            return UserIdentity(cached[1])
+
+        snapshot = self._load(user_id)
+        if snapshot is None:
+            return None
+
+        with self._lock:
+            if len(self._snapshots) >= IDENTITY_CACHE_SIZE:
+                self._snapshots = {}
+            self._snapshots[user_id] = (now + IDENTITY_TTL, snapshot)
+        return UserIdentity(snapshot)
+
+    def invalidate(self):
+        self.version.bump()
+
+
+identities = IdentityCache()
+
+
+@event.listens_for(Session, "after_flush")
+def _identity_after_flush(session, flush_context):
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, (Users, Staff, Reviewer)):
+            session.info["se_identity_changed"] = True
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def _identity_after_commit(session):
+    if session.info.pop("se_identity_changed", False):
+        identities.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _identity_after_rollback(session):
+    session.info.pop("se_identity_changed", None)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+import fcntl
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+from flask_se_config import SQLITE_DATABASE_PATH
+
+log = logging.getLogger("flask_se.leader")
+
+LEADER_RETRY_INTERVAL = 5
+# A leader which did not update its status for this long is reported as stale
+LEADER_STALE_AFTER = 6 * LEADER_RETRY_INTERVAL
+
+
+class LeaderElection:
+    """Elects one process on the host (uWSGI worker or background worker) to
+    run the scheduled jobs.
+
+    Processes compete for an exclusive flock() on databases/<name>.lock. The
+    kernel releases the lock as soon as the holder exits or is killed, the
+    other processes retry every LEADER_RETRY_INTERVAL seconds and one of them
+    takes over. The leader keeps its status in databases/<name>.json."""
+
+    def __init__(self, name, on_elected, describe=None):
+        self.name = name
+        self.lock_filename = os.path.join(SQLITE_DATABASE_PATH, name + ".lock")
+        self.status_filename = os.path.join(SQLITE_DATABASE_PATH, name + ".json")
+        self.on_elected = on_elected
+        # Returns a dict with details for the status page, e.g. the jobs
+        self.describe = describe
+        self.is_leader = False
+        self.elected_at = None
+        self._lock_file = None
+        self._thread = None
+        self._pid = None
+
+    @property
+    def source(self):
+        return "%s-%d" % (socket.gethostname(), os.getpid())
+
+    def _try_acquire(self):
+        lock_file = open(self.lock_filename, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+
+        # Keep the file open, closing it releases the lock
+        self._lock_file = lock_file
+        return True
+
+    def _write_status(self):
+        status = {
+            "source": self.source,
+            "elected_at": self.elected_at,
+            "heartbeat": time.time(),
+        }
+        if self.describe is not None:
+            try:
+                status.update(self.describe())
+            except Exception:
+                log.exception("Can't describe %s leader", self.name)
+
+        tmp_filename = "%s.%d.tmp" % (self.status_filename, os.getpid())
+        with open(tmp_filename, "w") as file:
+            json.dump(status, file)
+        os.replace(tmp_filename, self.status_filename)
+
+    def _run(self):
+        while not self.is_leader:
+            try:
+                acquired = self._try_acquire()
+            except OSError:
+                log.exception("Can't open %s", self.lock_filename)
+                acquired = False
+
+            if not acquired:
+                time.sleep(LEADER_RETRY_INTERVAL)
+                continue
+
+            self.is_leader = True
+            self.elected_at = time.time()
+            log.info("%s is the %s leader now", self.source, self.name)
+            self.on_elected()
+
+        while True:
+            try:
+                self._write_status()
+            except OSError:
+                log.exception("Can't write %s", self.status_filename)
+            time.sleep(LEADER_RETRY_INTERVAL)
+
+    def start(self):
+        """Start competing for the leadership in a background thread."""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+
+        self._pid = os.getpid()
+        self._thread = threading.Thread(
+            target=self._run, name="%s-election" % self.name, daemon=True
+        )
+        self._thread.start()
+
+    def start_in_worker(self):
+        """Same as start(), but under uWSGI waits until the worker is forked.
+
+        Without lazy-apps uWSGI imports the app in the master process, a lock
+        taken there would be inherited by every worker."""
+        try:
+            import uwsgi
+            from uwsgidecorators import postfork
+        except ImportError:
+            self.start()
+            return
+
+        if uwsgi.worker_id() > 0:
+            self.start()
+        else:
+            postfork(self.start)
+
+    def status(self):
+        try:
+            with open(self.status_filename, "r") as file:
+                leader = json.load(file)
+        except (OSError, ValueError):
+            leader = None
+
+        if leader is not None:
+            leader["stale"] = time.time() - leader["heartbeat"] > LEADER_STALE_AFTER
+
+        return {
+            "leader": leader,
+            "process": {"source": self.source, "is_leader": self.is_leader},
+        }
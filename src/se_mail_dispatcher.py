@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import time
+
+from se_metrics import metrics
+from se_wakeup import mail_wakeup
+from se_sendmail import (
+    MAIL_BATCH_SIZE,
+    SmtpSession,
+    claim_notifications,
+    finish_batch,
+    group_digests,
+    outbox_worker_name,
+    prepare_message,
+    record_server_error,
+    send_prepared,
+)
+
+log = logging.getLogger("flask_se.mail")
+
+# Connections kept open to the mail server, i.e. messages sent at once
+MAIL_DISPATCH_CONNECTIONS = 4
+# mail.spbu.ru throttles senders, stay below its limit
+MAIL_RATE_PER_SECOND = 20
+# Woken up by new notifications, polls for missed wakeups, digests and retries
+MAIL_DISPATCH_POLL_SECONDS = 60
+
+
+class RateLimiter:
+    """Token bucket: at most `rate` messages per second on average and at
+    most `burst` of them back to back."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            while True:
+                now = loop.time()
+                if self.updated is not None:
+                    elapsed = now - self.updated
+                    self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class MailDispatcher:
+    """Sends the outbox with several SMTP connections at once.
+
+    Claiming and finishing batches (SQLite) happen in the event loop thread,
+    which holds the app context. smtplib is blocking, so every pooled
+    connection does its I/O in a worker thread; concurrency is bounded by
+    the number of connections and the rate by a token bucket."""
+
+    def __init__(
+        self,
+        host=None,
+        port=None,
+        connections=MAIL_DISPATCH_CONNECTIONS,
+        rate=MAIL_RATE_PER_SECOND,
+        batch_size=MAIL_BATCH_SIZE,
+    ):
+        self.sessions = [SmtpSession(host, port) for _ in range(connections)]
+        self.host = self.sessions[0].host
+        self.port = self.sessions[0].port
+        self.rate = rate
+        self.batch_size = batch_size
+        self.worker = outbox_worker_name()
+        # Created in the event loop, the limiter's lock belongs to it
+        self.limiter = None
+
+    async def _send_group(self, pool, group, state):
+        prepared = prepare_message(group)
+
+        session = await pool.get()
+        try:
+            # After a server error the rest of the batch is left for later
+            if state["server_error"] is not None:
+                return [], []
+            if prepared is not None:
+                await self.limiter.acquire()
+            delivered, failed, server_error = await asyncio.to_thread(
+                send_prepared, session, group, prepared
+            )
+            if server_error is not None and state["server_error"] is None:
+                state["server_error"] = server_error
+            return delivered, failed
+        finally:
+            pool.put_nowait(session)
+
+    async def drain(self):
+        """Send everything that is due now, returns the number of sent
+        notifications."""
+        pool = asyncio.Queue()
+        for session in self.sessions:
+            pool.put_nowait(session)
+        if self.limiter is None:
+            self.limiter = RateLimiter(self.rate, len(self.sessions))
+
+        sent = 0
+        try:
+            while True:
+                batch = claim_notifications(self.worker, self.batch_size)
+                if not batch:
+                    break
+
+                started = time.perf_counter()
+                state = {"server_error": None}
+                results = await asyncio.gather(
+                    *(
+                        self._send_group(pool, group, state)
+                        for group in group_digests(batch)
+                    )
+                )
+
+                delivered = [
+                    i for group_delivered, _ in results for i in group_delivered
+                ]
+                failed = [f for _, group_failed in results for f in group_failed]
+                finish_batch(batch, delivered, failed, time.perf_counter() - started)
+                sent += len(delivered)
+
+                if state["server_error"] is not None:
+                    record_server_error(self.host, self.port, state["server_error"])
+                    break
+        finally:
+            for session in self.sessions:
+                await asyncio.to_thread(session.close)
+
+        return sent
+
+    async def serve(self, poll_interval=MAIL_DISPATCH_POLL_SECONDS):
+        mail_wakeup.listen()
+        try:
+            while True:
+                try:
+                    sent = await self.drain()
+                    if sent:
+                        log.info("Sent %d notifications", sent)
+                except Exception:
+                    log.exception("Mail dispatcher failed")
+                metrics.flush()
+                await mail_wakeup.wait_async(poll_interval)
+        finally:
+            mail_wakeup.close()
+
+
+def run_mail_dispatcher(app, **kwargs):
+    """Entry point of the mail worker: python se_worker.py mail_dispatcher"""
+    with app.app_context():
+        asyncio.run(MailDispatcher(**kwargs).serve())
@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+
+import fcntl
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+from flask import g, request, has_request_context
+from flask import before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from flask_se_config import SQLITE_DATABASE_PATH
+
+log = logging.getLogger("flask_se.metrics")
+
+# Every process (uWSGI worker, background worker) periodically dumps its
+# counters to its own file here, the metrics page sums them up.
+METRICS_DIR = os.path.join(SQLITE_DATABASE_PATH, "metrics")
+METRICS_FLUSH_INTERVAL = 15
+# Gauges of processes that did not flush for this long are not summed up
+METRICS_STALE_AFTER = 10 * METRICS_FLUSH_INTERVAL
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_REQUEST_SECONDS = 2.0
+
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('%s="%s"' % (k, _escape(v)) for k, v in pairs) + "}"
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _sum_snapshots(snapshots, now):
+    """Counters and histograms of the snapshots summed up, gauges of the
+    ones flushed within METRICS_STALE_AFTER too."""
+    counters = {}
+    gauges = {}
+    histograms = {}
+    for s in snapshots:
+        for n, l, v in s["counters"]:
+            key = (n, tuple(map(tuple, l)))
+            counters[key] = counters.get(key, 0) + v
+        if now - s["time"] < METRICS_STALE_AFTER:
+            for n, l, v in s["gauges"]:
+                key = (n, tuple(map(tuple, l)))
+                gauges[key] = gauges.get(key, 0) + v
+        for n, l, b, h in s["histograms"]:
+            key = (n, tuple(map(tuple, l)), tuple(b))
+            if key in histograms:
+                histograms[key] = [x + y for x, y in zip(histograms[key], h)]
+            else:
+                histograms[key] = list(h)
+    return counters, gauges, histograms
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Per-process counters, gauges and histograms in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._descriptions = {}
+        self._collectors = []
+        self._flushed_at = 0.0
+        self._retired_source = None
+
+    @property
+    def source(self):
+        # uWSGI forks workers after import, so the pid is not known in advance
+        return "%s-%d" % (socket.gethostname(), os.getpid())
+
+    def describe(self, name, metric_type, description):
+        self._descriptions[name] = (metric_type, description)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, _labels_key(labels), tuple(buckets))
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = [0] * len(buckets) + [0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    h[i] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    def add_collector(self, collector):
+        """Register a function called on scrape, it returns (name, labels, value)
+        gauges which are global (e.g. computed from the database) and therefore
+        are not summed across processes."""
+        self._collectors.append(collector)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "source": self.source,
+                "time": time.time(),
+                "counters": [[n, l, v] for (n, l), v in self._counters.items()],
+                "gauges": [[n, l, v] for (n, l), v in self._gauges.items()],
+                "histograms": [
+                    [n, l, list(b), list(h)]
+                    for (n, l, b), h in self._histograms.items()
+                ],
+            }
+
+    def flush(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._flushed_at < METRICS_FLUSH_INTERVAL:
+            return
+        self._flushed_at = now
+
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            if self._retired_source != self.source:
+                self._retire_finished()
+                self._retired_source = self.source
+
+            filename = os.path.join(METRICS_DIR, self.source + ".json")
+            tmp_filename = filename + ".tmp"
+            with open(tmp_filename, "w") as file:
+                json.dump(self.snapshot(), file)
+            os.replace(tmp_filename, filename)
+        except OSError:
+            # Metrics must never break the request
+            pass
+
+    def _retire_finished(self):
+        """Fold the snapshots of the finished processes of this host into
+        <host>-retired.json, so restarts do not leave files that every scrape
+        reads. Done on the first flush of a process; a file with its own name
+        is left by an earlier process with the same pid."""
+        host = socket.gethostname()
+        retired_filename = os.path.join(METRICS_DIR, host + "-retired.json")
+
+        with open(os.path.join(METRICS_DIR, host + ".lock"), "w") as lock:
+            # Processes started together must not fold the same files twice
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            finished = []
+            for filename in os.listdir(METRICS_DIR):
+                source, ext = os.path.splitext(filename)
+                prefix, _, pid = source.rpartition("-")
+                if ext != ".json" or prefix != host or not pid.isdigit():
+                    continue
+                if source == self.source or not _process_alive(int(pid)):
+                    finished.append(os.path.join(METRICS_DIR, filename))
+            if not finished:
+                return
+
+            snapshots = []
+            for filename in [retired_filename] + finished:
+                try:
+                    with open(filename, "r") as file:
+                        snapshots.append(json.load(file))
+                except (OSError, ValueError):
+                    continue
+
+            # Counters and histograms only, gauges of a finished process
+            # mean nothing
+            counters, _, histograms = _sum_snapshots(snapshots, float("inf"))
+            retired = {
+                "source": host + "-retired",
+                "time": time.time(),
+                "counters": [[n, l, v] for (n, l), v in counters.items()],
+                "gauges": [],
+                "histograms": [
+                    [n, l, list(b), h] for (n, l, b), h in histograms.items()
+                ],
+            }
+            tmp_filename = retired_filename + ".tmp"
+            with open(tmp_filename, "w") as file:
+                json.dump(retired, file)
+            os.replace(tmp_filename, retired_filename)
+
+            for filename in finished:
+                os.remove(filename)
+
+    def _load_snapshots(self):
+        snapshots = [self.snapshot()]
+        try:
+            filenames = os.listdir(METRICS_DIR)
+        except OSError:
+            return snapshots
+
+        for filename in filenames:
+            if not filename.endswith(".json") or filename == self.source + ".json":
+                continue
+            try:
+                with open(os.path.join(METRICS_DIR, filename), "r") as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self, aggregate=True):
+        snapshots = self._load_snapshots() if aggregate else [self.snapshot()]
+        counters, gauges, histograms = _sum_snapshots(snapshots, time.time())
+
+        for collector in self._collectors:
+            try:
+                for n, labels, v in collector():
+                    gauges[(n, _labels_key(labels))] = v
+            except Exception:
+                continue
+
+        families = {}
+        for (n, l), v in counters.items():
+            families.setdefault(n, []).append(
+                _format_labels(l) + " " + _format_value(v)
+            )
+        for (n, l), v in gauges.items():
+            families.setdefault(n, []).append(
+                _format_labels(l) + " " + _format_value(v)
+            )
+
+        lines = []
+        for n in sorted(families):
+            metric_type, description = self._descriptions.get(n, ("untyped", n))
+            lines.append("# HELP %s %s" % (n, description))
+            lines.append("# TYPE %s %s" % (n, metric_type))
+            lines.extend(n + sample for sample in sorted(families[n]))
+
+        described = set()
+        for (n, l, b), h in sorted(histograms.items()):
+            if n not in described:
+                metric_type, description = self._descriptions.get(n, ("histogram", n))
+                lines.append("# HELP %s %s" % (n, description))
+                lines.append("# TYPE %s histogram" % n)
+                described.add(n)
+            for bound, count in zip(b, h):
+                labels = _format_labels(l, [("le", _format_value(float(bound)))])
+                lines.append("%s_bucket%s %d" % (n, labels, count))
+            labels = _format_labels(l, [("le", "+Inf")])
+            lines.append("%s_bucket%s %d" % (n, labels, h[-1]))
+            lines.append("%s_sum%s %s" % (n, _format_labels(l), repr(float(h[-2]))))
+            lines.append("%s_count%s %d" % (n, _format_labels(l), h[-1]))
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+metrics.describe(
+    "se_http_request_duration_seconds", "histogram", "Request latency by endpoint."
+)
+metrics.describe(
+    "se_sql_statements_total", "counter", "SQL statements executed by endpoint."
+)
+metrics.describe(
+    "se_sql_duration_seconds_total", "counter", "Time spent in SQL by endpoint."
+)
+metrics.describe(
+    "se_template_render_seconds_total", "counter", "Time spent in Jinja by endpoint."
+)
+
+
+def _current_request_metrics():
+    if not has_request_context():
+        return None
+    return g.get("_metrics")
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["se_query_start"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    m = _current_request_metrics()
+    if m is not None:
+        m["sql_count"] += 1
+        m["sql_time"] += time.perf_counter() - conn.info["se_query_start"]
+
+
+def _before_render_template(sender, template, context, **extra):
+    m = _current_request_metrics()
+    if m is not None:
+        m["render_stack"].append(time.perf_counter())
+
+
+def _template_rendered(sender, template, context, **extra):
+    m = _current_request_metrics()
+    if m is not None and m["render_stack"]:
+        started = m["render_stack"].pop()
+        # Count only the outermost render_template() call
+        if not m["render_stack"]:
+            m["render_time"] += time.perf_counter() - started
+
+
+def _start_request():
+    g._metrics = {
+        "start": time.perf_counter(),
+        "sql_count": 0,
+        "sql_time": 0.0,
+        "render_time": 0.0,
+        "render_stack": [],
+    }
+
+
+def _finish_request(exc):
+    m = g.pop("_metrics", None)
+    if m is None:
+        return
+
+    duration = time.perf_counter() - m["start"]
+    endpoint = request.endpoint or "unknown"
+
+    metrics.observe("se_http_request_duration_seconds", duration, endpoint=endpoint)
+    metrics.inc("se_sql_statements_total", m["sql_count"], endpoint=endpoint)
+    metrics.inc("se_sql_duration_seconds_total", m["sql_time"], endpoint=endpoint)
+    metrics.inc("se_template_render_seconds_total", m["render_time"], endpoint=endpoint)
+
+    if duration > SLOW_REQUEST_SECONDS:
+        log.warning(
+            "slow request endpoint=%s duration=%.3f sql_count=%d sql_time=%.3f render_time=%.3f",
+            endpoint,
+            duration,
+            m["sql_count"],
+            m["sql_time"],
+            m["render_time"],
+        )
+
+    metrics.flush()
+
+
+def init_metrics(app):
+    app.before_request(_start_request)
+    app.teardown_request(_finish_request)
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
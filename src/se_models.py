@@ -1,14 +1,17 @@
 # -*- coding: utf-8 -*-
 
 from os import urandom, path
+import json
 import shutil
 
 from datetime import datetime, timedelta
 from pathlib import Path
 
+import numpy as np
 import pytz
 from dateutil import tz
-from sqlalchemy import MetaData
+from sqlalchemy import DDL, MetaData, column, event, insert, table
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from flask import render_template
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
@@ -19,11 +22,12 @@ from datetime import datetime
 
 from flask_se_config import (
     post_ranking_score,
-    get_hours_since,
     SQLITE_DATABASE_NAME,
     SQLITE_DATABASE_BACKUP_NAME,
     SQLITE_DATABASE_PATH,
+    MAIL_DIGEST_WINDOW_MINUTES,
 )
+from se_wakeup import mail_wakeup
 
 convention = {
     "ix": "ix_%(column_0_label)s",
@@ -148,6 +152,8 @@ class Users(db.Model, UserMixin):
 
     role = db.Column(db.Integer, default=0, nullable=False)
     how_to_contact = db.Column(db.String(512), default="", nullable=True)
+    # Collect non-urgent mail notifications into one message per window
+    mail_digest = db.Column(db.Boolean, default=False, nullable=False)
 
     vk_id = db.Column(db.String(255), nullable=True)
     fb_id = db.Column(db.String(255), nullable=True)
@@ -206,8 +212,26 @@ class Users(db.Model, UserMixin):
 
         return full_name
 
+    # Same fields as se_identity.UserIdentity, which is current_user normally
+    @property
+    def staff_id(self):
+        staff = Staff.query.with_entities(Staff.id).filter_by(user_id=self.id).first()
+        return staff[0] if staff else None
+
+    @property
+    def reviewer_id(self):
+        reviewer = (
+            Reviewer.query.with_entities(Reviewer.id).filter_by(user_id=self.id).first()
+        )
+        return reviewer[0] if reviewer else None
+
+    @property
     def is_staff(self):
-        return Staff.query.filter_by(user_id=self.id).first() is not None
+        return self.staff_id is not None
+
+    @property
+    def is_reviewer(self):
+        return self.reviewer_id is not None
 
     def __str__(self):
         full_name = ""
@@ -395,14 +419,14 @@ class Internships(db.Model):
     format = db.relationship(
         "InternshipFormat",
         secondary=internships_format,
-        lazy="subquery",
+        lazy="select",
         backref=db.backref("internship", lazy=True),
         order_by=internships_format.c.internships_format_id,
     )
     tag = db.relationship(
         "InternshipTag",
         secondary=internships_tag,
-        lazy="subquery",
+        lazy="select",
         backref=db.backref("internship", lazy=True),
         order_by=internships_tag.c.internships_tag_id,
     )
@@ -525,7 +549,7 @@ class Tags(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(64), nullable=False)
     tags = db.relationship(
-        "Thesis", secondary=tag, lazy="subquery", backref=db.backref("tags", lazy=True)
+        "Thesis", secondary=tag, lazy="select", backref=db.backref("tags", lazy=True)
     )
 
 
@@ -569,7 +593,7 @@ class Posts(db.Model):
         server_onupdate=db.func.now(),
     )
 
-    rank = db.Column(db.Float, nullable=False, default=post_ranking_score)
+    rank = db.Column(db.Float, nullable=False, default=post_ranking_score, index=True)
     author_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     all_news_votes = db.relationship("PostVote", back_populates="post")
 
@@ -581,7 +605,7 @@ class PostVote(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
     user = db.relationship("Users", back_populates="all_user_votes")
 
-    post_id = db.Column(db.Integer, db.ForeignKey("posts.id"))
+    post_id = db.Column(db.Integer, db.ForeignKey("posts.id"), primary_key=True)
     post = db.relationship("Posts", back_populates="all_news_votes")
 
     upvote = db.Column(db.Boolean, nullable=False)
@@ -636,7 +660,7 @@ class DiplomaThemes(db.Model):
     levels = db.relationship(
         "ThemesLevel",
         secondary=diploma_themes_level,
-        lazy="subquery",
+        lazy="select",
         backref=db.backref("diploma_themes", lazy=True),
         order_by=diploma_themes_level.c.themes_level_id,
     )
@@ -645,7 +669,9 @@ class DiplomaThemes(db.Model):
     company = db.relationship("Company", back_populates="theme")
 
     author_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
-    supervisor_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
+    supervisor_id = db.Column(
+        db.Integer, db.ForeignKey("users.id"), nullable=True, index=True
+    )
     supervisor_thesis_id = db.Column(
         db.Integer, db.ForeignKey("users.id"), nullable=True
     )
@@ -664,7 +690,7 @@ class DiplomaThemesTags(db.Model):
     tags = db.relationship(
         "DiplomaThemes",
         secondary=diploma_themes_tag,
-        lazy="subquery",
+        lazy="select",
         backref=db.backref("diploma_themes_tags", lazy=True),
     )
 
@@ -775,24 +801,298 @@ class Notification(db.Model):
     title = db.Column(db.String(512), nullable=True)
     content = db.Column(db.String(8192), nullable=True)
 
+    # Outbox state, delivered notifications are deleted
+    # 0 - pending
+    # 1 - dead, delivery failed permanently or too many times
+    status = db.Column(db.Integer, default=0, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Sender which is delivering the notification right now and until when
+    claimed_by = db.Column(db.String(255), nullable=True)
+    claimed_until = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.String(512), nullable=True)
+    # Sent together with the other digest notifications of the recipient
+    digest = db.Column(db.Boolean, default=False, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_notification_status_next_attempt_at", "status", "next_attempt_at"),
+    )
 
-def recalculate_post_rank():
-    posts = Posts.query.order_by(Posts.id.desc()).limit(100).all()
 
-    for post in posts:
-        age = get_hours_since(post.created_on)
-        post.rank = post_ranking_score(post.votes, age, post.views)
+# Relative rank change worth writing back, see recalculate_post_rank()
+POST_RANK_TOLERANCE = 0.01
 
+
+def recalculate_post_rank():
+    """Recalculate the rank of every post in one vectorized pass, write back
+    only the ranks which changed by more than POST_RANK_TOLERANCE. All ranks
+    decay with age at the same rate, so old posts keep their order while
+    their ranks are updated less often. Returns the number of updated posts."""
+    updated = refresh_post_ranks(db.session.connection(), tolerance=POST_RANK_TOLERANCE)
     db.session.commit()
+    return updated
+
+
+def refresh_post_ranks(connection, post_ids=None, tolerance=0):
+    """Recalculate the ranks of the posts (all if post_ids is None) and write
+    them back with one executemany, commit is up to caller."""
+    # SQLite computes the ages, parsing 10^5 dates in Python takes longer
+    # than the rest of the pass
+    hours = (db.func.julianday("now") - db.func.julianday(Posts.created_on)) * 24
+    query = db.select(Posts.id, Posts.votes, Posts.views, hours, Posts.rank)
+    if post_ids is not None:
+        query = query.where(Posts.id.in_(post_ids))
+
+    # Core rows, the ORM result layer would double the time of the pass
+    posts = connection.execute(query).all()
+    if not posts:
+        return 0
+
+    ids, votes, views, hours, ranks = (np.array(c) for c in zip(*posts))
+    new_ranks = post_ranking_score(votes, np.trunc(hours), views)
+
+    changed = ~np.isclose(new_ranks, ranks, rtol=tolerance, atol=0)
+    updates = [
+        {"post_id": int(i), "post_rank": float(rank)}
+        for i, rank in zip(ids[changed], new_ranks[changed])
+    ]
+    if updates:
+        connection.execute(
+            db.update(Posts.__table__)
+            .where(Posts.id == db.bindparam("post_id"))
+            .values(rank=db.bindparam("post_rank")),
+            updates,
+        )
+    return len(updates)
+
+
+def vote_for_post(user_id, post_id, upvote):
+    """Record the vote in the PostVote ledger and move the counter of the post
+    by the difference in the same transaction. SQLite takes the write lock on
+    the first statement, so concurrent votes wait for each other instead of
+    losing updates. Returns False if the user has already voted this way."""
+    value = 1 if upvote else -1
+    changed = db.session.execute(
+        db.update(PostVote)
+        .where(
+            PostVote.user_id == user_id,
+            PostVote.post_id == post_id,
+            PostVote.upvote != upvote,
+        )
+        .values(upvote=upvote, timestamp=db.func.now())
+    ).rowcount
+    if changed:
+        delta = 2 * value
+    else:
+        inserted = db.session.execute(
+            sqlite_insert(PostVote)
+            .values(user_id=user_id, post_id=post_id, upvote=upvote)
+            .on_conflict_do_nothing()
+        ).rowcount
+        if not inserted:
+            db.session.rollback()
+            return False
+        delta = value
+
+    db.session.execute(
+        db.update(Posts).where(Posts.id == post_id).values(votes=Posts.votes + delta)
+    )
+    db.session.commit()
+    return True
+
+
+# Full-text index of the news: an FTS5 table over the text columns of posts
+# (external content, the text itself is not copied) which the triggers keep
+# up to date. Updates of votes, views and rank do not touch it.
+POSTS_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5("
+    "title, text, domain, content='posts', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN "
+    "INSERT INTO posts_fts(rowid, title, text, domain) "
+    "VALUES (new.id, new.title, new.text, new.domain); END",
+    "CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN "
+    "INSERT INTO posts_fts(posts_fts, rowid, title, text, domain) "
+    "VALUES ('delete', old.id, old.title, old.text, old.domain); END",
+    "CREATE TRIGGER IF NOT EXISTS posts_fts_update "
+    "AFTER UPDATE OF title, text, domain ON posts BEGIN "
+    "INSERT INTO posts_fts(posts_fts, rowid, title, text, domain) "
+    "VALUES ('delete', old.id, old.title, old.text, old.domain); "
+    "INSERT INTO posts_fts(rowid, title, text, domain) "
+    "VALUES (new.id, new.title, new.text, new.domain); END",
+    # The index may be left from a dropped posts table
+    "INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')",
+)
+
+for statement in POSTS_FTS_DDL:
+    event.listen(Posts.__table__, "after_create", DDL(statement))
+
+# Not a model: the metadata must not create or drop it
+posts_fts = table("posts_fts", column("rowid"))
+
+# Rank at which a post found by the news search gets half of the full boost,
+# see search_posts()
+NEWS_SEARCH_RANK_BOOST = 0.001
+
+# Full-text index of the approved diploma themes, the only ones searched.
+# Contentless, as it covers only a part of the table: a search gives the ids.
+# The triggers add a theme when it gets approved and remove it when it is
+# archived, rejected or deleted, edits of an approved theme are reindexed.
+THEMES_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS diploma_themes_fts USING fts5("
+    "title, description, requirements, content='', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS diploma_themes_fts_insert "
+    "AFTER INSERT ON diploma_themes WHEN new.status = 2 BEGIN "
+    "INSERT INTO diploma_themes_fts(rowid, title, description, requirements) "
+    "VALUES (new.id, new.title, new.description, new.requirements); END",
+    "CREATE TRIGGER IF NOT EXISTS diploma_themes_fts_delete "
+    "AFTER DELETE ON diploma_themes WHEN old.status = 2 BEGIN "
+    "INSERT INTO diploma_themes_fts"
+    "(diploma_themes_fts, rowid, title, description, requirements) "
+    "VALUES ('delete', old.id, old.title, old.description, old.requirements); "
+    "END",
+    # One trigger, so the old entry is always deleted before the new one
+    "CREATE TRIGGER IF NOT EXISTS diploma_themes_fts_update "
+    "AFTER UPDATE OF title, description, requirements, status ON diploma_themes "
+    "BEGIN "
+    "INSERT INTO diploma_themes_fts"
+    "(diploma_themes_fts, rowid, title, description, requirements) "
+    "SELECT 'delete', old.id, old.title, old.description, old.requirements "
+    "WHERE old.status = 2; "
+    "INSERT INTO diploma_themes_fts(rowid, title, description, requirements) "
+    "SELECT new.id, new.title, new.description, new.requirements "
+    "WHERE new.status = 2; END",
+    # The index may be left from a dropped table
+    "INSERT INTO diploma_themes_fts(diploma_themes_fts) VALUES ('delete-all')",
+    "INSERT INTO diploma_themes_fts(rowid, title, description, requirements) "
+    "SELECT id, title, description, requirements FROM diploma_themes "
+    "WHERE status = 2",
+)
+
+for statement in THEMES_FTS_DDL:
+    event.listen(DiplomaThemes.__table__, "after_create", DDL(statement))
 
+diploma_themes_fts = table("diploma_themes_fts", column("rowid"))
 
-def add_mail_notification(user_id, title, content):
-    if not Users.query.filter_by(id=user_id).first():
+
+def add_mail_notification(user_id, title, content, urgent=False):
+    user = db.session.get(Users, user_id)
+    if not user:
         return
 
     n = Notification(recipient=user_id, title=title, content=content)
+    if user.mail_digest and not urgent:
+        n.digest = True
+        n.next_attempt_at = get_digest_due_time(user_id)
     db.session.add(n)
     db.session.commit()
+    if not n.digest:
+        mail_wakeup.notify()
+
+
+def render_key(variables):
+    """Key of the rendering of a template with variables. Plain values (also
+    lists and dicts of them) are compared by JSON, any other object, e.g. a
+    model, by identity: two theses with the same title are not the same."""
+    key = []
+    for name, value in sorted(variables.items()):
+        try:
+            key.append((name, json.dumps(value, sort_keys=True)))
+        except (TypeError, ValueError):
+            key.append((name, id(value)))
+    return tuple(key)
+
+
+def add_mail_notifications(
+    recipients, title, template, context=None, practice_content=None, urgent=False
+):
+    """Notify many users at once: one query for the recipients, multi-row
+    inserts and a single commit.
+
+    recipients is a list of user ids or a dict mapping a user id to the
+    template variables of that user, the shared ones are in context. The
+    template is rendered once per distinct set of variables, a message to a
+    whole cohort is rendered once. practice_content adds the same in-site
+    notification for everyone. Unknown users are skipped, returns the ids of
+    the notified ones."""
+    if not isinstance(recipients, dict):
+        recipients = dict.fromkeys(recipients)
+    context = context or {}
+
+    users = (
+        db.session.query(Users.id, Users.mail_digest)
+        .filter(Users.id.in_(recipients))
+        .all()
+    )
+    if not users:
+        return []
+
+    digest_users = [] if urgent else [u.id for u in users if u.mail_digest]
+    due_times = get_digest_due_times(digest_users)
+    now = datetime.utcnow()
+
+    rendered = {}
+    notifications = []
+    for user in users:
+        variables = recipients[user.id] or {}
+        key = render_key(variables)
+        if key not in rendered:
+            rendered[key] = render_template(template, **context, **variables)
+
+        notifications.append(
+            {
+                "recipient": user.id,
+                "title": title,
+                "content": rendered[key],
+                "digest": user.id in due_times,
+                "next_attempt_at": due_times.get(user.id, now),
+            }
+        )
+    db.session.execute(insert(Notification), notifications)
+
+    if practice_content is not None:
+        db.session.execute(
+            insert(NotificationPractice),
+            [{"recipient_id": user.id, "content": practice_content} for user in users],
+        )
+
+    db.session.commit()
+    if len(due_times) < len(users):
+        mail_wakeup.notify()
+    return [user.id for user in users]
+
+
+def get_digest_due_time(user_id):
+    return get_digest_due_times([user_id])[user_id]
+
+
+def get_digest_due_times(user_ids):
+    """Digest notifications of a user are due together: at the end of the
+    window opened by the first of them."""
+    if not user_ids:
+        return {}
+
+    now = datetime.utcnow()
+    due_times = dict.fromkeys(
+        user_ids, now + timedelta(minutes=MAIL_DIGEST_WINDOW_MINUTES)
+    )
+    due_times.update(
+        db.session.query(
+            Notification.recipient, db.func.min(Notification.next_attempt_at)
+        )
+        .filter(
+            Notification.recipient.in_(user_ids),
+            Notification.digest.is_(True),
+            Notification.status == 0,
+            Notification.attempts == 0,
+            Notification.next_attempt_at > now,
+        )
+        .group_by(Notification.recipient)
+        .all()
+    )
+    return due_times
 
 
 def init_db():
@@ -3027,203 +3327,180 @@ def init_db():
     db.drop_all()
     db.create_all()
 
-    # Create areas
+    # Everything below is inserted with one executemany per table and
+    # committed once. Ids follow the list order, the data above refers to
+    # users, companies and levels by their position.
     print("Create areas")
-    for area in areas:
-        a = AreasOfStudy(area=area["area"])
-
-        db.session.add(a)
-        db.session.commit()
+    bulk_insert(AreasOfStudy, [{"area": area["area"]} for area in areas])
 
-    # Create users
     print("Create users")
-    for user in users:
-        u = Users(
-            email=user["email"],
-            password_hash=generate_password_hash(urandom(16).hex()),
-            first_name=user["first_name"],
-            last_name=user["last_name"],
-            middle_name=user["middle_name"],
-            avatar_uri=user["avatar_uri"],
-        )
-
-        db.session.add(u)
-        db.session.commit()
+    user_ids = bulk_insert(
+        Users,
+        [
+            {
+                "email": user["email"],
+                "password_hash": generate_password_hash(urandom(16).hex()),
+                "first_name": user["first_name"],
+                "last_name": user["last_name"],
+                "middle_name": user["middle_name"],
+                "avatar_uri": user["avatar_uri"],
+            }
+            for user in users
+        ],
+    )
+    user_id_by_email = {
+        user["email"]: user_id for user, user_id in zip(users, user_ids)
+    }
 
-    # Create staff
     print("Create staff")
-    for user in staff:
-        u = Users.query.filter_by(email=user["official_email"]).first()
-
-        if "science_degree" in user:
-            s = Staff(
-                position=user["position"],
-                science_degree=user["science_degree"],
-                official_email=user["official_email"],
-                still_working=user["still_working"],
-                user_id=u.id,
-            )
-        else:
-            s = Staff(
-                position=user["position"],
-                official_email=user["official_email"],
-                still_working=user["still_working"],
-                user_id=u.id,
-            )
-
-        db.session.add(s)
-        db.session.commit()
+    bulk_insert(
+        Staff,
+        [
+            {
+                "position": user["position"],
+                "science_degree": user.get("science_degree"),
+                "official_email": user["official_email"],
+                "still_working": user["still_working"],
+                "user_id": user_id_by_email[user["official_email"]],
+            }
+            for user in staff
+        ],
+    )
 
-    # Create WorkTypes
     print("Create worktypes")
-    for w in wtypes:
-        wt = Worktype(type=w["type"])
-        db.session.add(wt)
-        db.session.commit()
+    bulk_insert(Worktype, [{"type": w["type"]} for w in wtypes])
 
-    # Create Courses
     print("Create courses")
-    for course in courses:
-        c = Courses(name=course["name"], code=course["code"])
-        db.session.add(c)
-        db.session.commit()
+    bulk_insert(
+        Courses,
+        [{"name": course["name"], "code": course["code"]} for course in courses],
+    )
 
-    # Create Curriculum
     print("Create curriculum")
-    for cur in curriculum:
-        if "type" in cur:
-            c = Curriculum(
-                year=cur["year"],
-                discipline=cur["discipline"],
-                study_year=cur["study_year"],
-                type=cur["type"],
-                course_id=cur["course_id"],
-            )
-        else:
-            c = Curriculum(
-                year=cur["year"],
-                discipline=cur["discipline"],
-                study_year=cur["study_year"],
-                course_id=cur["course_id"],
-            )
-
-        db.session.add(c)
-        db.session.commit()
+    bulk_insert(
+        Curriculum,
+        [
+            {
+                "year": cur["year"],
+                "discipline": cur["discipline"],
+                "study_year": cur["study_year"],
+                "type": cur.get("type", 1),
+                "course_id": cur["course_id"],
+            }
+            for cur in curriculum
+        ],
+    )
 
-    # Create News
     print("Create news")
-    for cur in posts:
-        if "uri" in cur:
-            c = Posts(
-                title=cur["title"],
-                uri=cur["uri"],
-                domain="se.math.spbu.ru",
-                author_id=cur["author_id"],
-            )
-        else:
-            c = Posts(title=cur["title"], text=cur["text"], author_id=cur["author_id"])
-
-        db.session.add(c)
-        db.session.commit()
+    bulk_insert(
+        Posts,
+        [
+            {
+                "title": cur["title"],
+                "uri": cur.get("uri"),
+                "domain": "se.math.spbu.ru" if "uri" in cur else None,
+                "text": None if "uri" in cur else cur["text"],
+                "author_id": cur["author_id"],
+            }
+            for cur in posts
+        ],
+    )
 
-    for tag in tags:
-        t = Tags(name=tag["name"])
-        db.session.add(t)
-        db.session.commit()
+    tag_ids = bulk_insert(Tags, [{"name": tag["name"]} for tag in tags])
 
-    # Create Thesis
     print("Create thesis")
-    for work in thesis:
-        if "source_uri" in work:
-            t = Thesis(
-                name_ru=work["name_ru"],
-                name_en=work["name_en"],
-                description=work["description"],
-                text_uri=work["text_uri"],
-                presentation_uri=work["presentation_uri"],
-                supervisor_review_uri=work["supervisor_review_uri"],
-                reviewer_review_uri=work["reviewer_review_uri"],
-                author=work["author"],
-                supervisor_id=work["supervisor_id"],
-                reviewer_id=work["reviewer_id"],
-                publish_year=work["publish_year"],
-                type_id=work["type_id"],
-                course_id=1,
-                source_uri=work["source_uri"],
-            )
-        else:
-            t = Thesis(
-                name_ru=work["name_ru"],
-                name_en=work["name_en"],
-                description=work["description"],
-                text_uri=work["text_uri"],
-                presentation_uri=work["presentation_uri"],
-                supervisor_review_uri=work["supervisor_review_uri"],
-                reviewer_review_uri=work["reviewer_review_uri"],
-                author=work["author"],
-                supervisor_id=work["supervisor_id"],
-                reviewer_id=work["reviewer_id"],
-                publish_year=work["publish_year"],
-                type_id=work["type_id"],
-                course_id=1,
-            )
-
-        db.session.add(t)
-        db.session.commit()
-
-        # Adds tags
-        records = Tags.query.all()
-        for tag in records:
-            t.tags.append(tag)
-            db.session.commit()
-
-    # Create Companies
-    print("Create companies")
-    for cur in company:
-        c = Company(name=cur["name"], logo_uri=cur["logo_uri"])
+    thesis_ids = bulk_insert(
+        Thesis,
+        [
+            {
+                "name_ru": work["name_ru"],
+                "name_en": work["name_en"],
+                "description": work["description"],
+                "text_uri": work["text_uri"],
+                "presentation_uri": work["presentation_uri"],
+                "supervisor_review_uri": work["supervisor_review_uri"],
+                "reviewer_review_uri": work["reviewer_review_uri"],
+                "author": work["author"],
+                "supervisor_id": work["supervisor_id"],
+                "reviewer_id": work["reviewer_id"],
+                "publish_year": work["publish_year"],
+                "type_id": work["type_id"],
+                "course_id": 1,
+                "source_uri": work.get("source_uri"),
+            }
+            for work in thesis
+        ],
+    )
 
-        db.session.add(c)
-        db.session.commit()
+    # Every thesis gets every tag
+    bulk_insert_links(
+        tag,
+        [
+            {"tag_id": tag_id, "thesis_id": thesis_id}
+            for thesis_id in thesis_ids
+            for tag_id in tag_ids
+        ],
+    )
 
-    # Create ThemesLevels
-    print("Create diploma theme levels")
-    for cur in themes_level:
-        c = ThemesLevel(level=cur["level"])
+    print("Create companies")
+    bulk_insert(
+        Company,
+        [{"name": cur["name"], "logo_uri": cur["logo_uri"]} for cur in company],
+    )
 
-        db.session.add(c)
-        db.session.commit()
+    print("Create diploma theme levels")
+    bulk_insert(ThemesLevel, [{"level": cur["level"]} for cur in themes_level])
 
-    # Create DiplomaThems
     print("Create diploma themes")
-    for cur in d_themes:
-        c = DiplomaThemes(
-            title=cur["title"],
-            description=cur["description"],
-            company_id=cur["company_id"],
-            supervisor_id=cur["supervisor_id"],
-            consultant_id=cur["consultant_id"],
-            author_id=cur["author_id"],
-            status=cur["status"],
-        )
+    theme_ids = bulk_insert(
+        DiplomaThemes,
+        [
+            {
+                "title": cur["title"],
+                "description": cur["description"],
+                "company_id": cur["company_id"],
+                "supervisor_id": cur["supervisor_id"],
+                "consultant_id": cur["consultant_id"],
+                "author_id": cur["author_id"],
+                "status": cur["status"],
+            }
+            for cur in d_themes
+        ],
+    )
+    bulk_insert_links(
+        diploma_themes_level,
+        [
+            {"themes_level_id": tl_id, "diploma_themes_id": theme_id}
+            for cur, theme_id in zip(d_themes, theme_ids)
+            for tl_id in cur["levels"]
+        ],
+    )
 
-        for tl_id in cur["levels"]:
-            c.levels.append(ThemesLevel.query.filter_by(id=tl_id).first())
+    print("Create internship formats")
+    bulk_insert(
+        InternshipFormat, [{"format": cur["format"]} for cur in internship_formats]
+    )
 
-        db.session.add(c)
-        db.session.commit()
+    print("Create internship tags")
+    bulk_insert(InternshipTag, [{"tag": cur["tag"]} for cur in internship_tags])
 
-    # Create InternshipsFormat
-    print("Create internship formats")
-    print("Create addinternship formats")
-    for cur in internship_formats:
-        c = InternshipFormat(format=cur["format"])
+    db.session.commit()
 
-        db.session.add(c)
-        db.session.commit()
+    # Bulk inserts bypass the flask-msearch signals, index everything at once
+    print("Create search index")
+    search.update_index()
+
+
+def bulk_insert(model, rows):
+    """Insert rows with one executemany, ids continue after the largest one in
+    the table in the order of rows. Returns the ids, commit is up to caller."""
+    first_id = (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+    rows = [dict(row, id=i) for i, row in enumerate(rows, start=first_id)]
+    if rows:
+        db.session.execute(insert(model), rows)
+    return [row["id"] for row in rows]
 
-    print("Create internship tags")
-    for cur in internship_tags:
-        t = InternshipTag(tag=cur["tag"])
 
-        db.session.add(t)
-        db.session.commit()
+def bulk_insert_links(table, rows):
+    if rows:
+        db.session.execute(table.insert(), rows)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+
+from flask import current_app, render_template, request
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload
+
+from flask_se_config import get_hours_since, plural_hours
+from se_cache import SharedVersion
+from se_models import Posts
+
+log = logging.getLogger("flask_se.news_block")
+
+# A rendering is served as fresh this long, ages in it are shown in hours
+NEWS_BLOCK_TTL = 60
+NEWS_BLOCK_SIZE = 10
+
+
+class NewsBlock:
+    """Rendered news block of the homepage.
+
+    Every process keeps its last rendering. One older than NEWS_BLOCK_TTL or
+    made before a post was added, changed, deleted or voted for is still
+    served while a background thread renders the new one, so only the first
+    visitor after a process start waits for the queries."""
+
+    def __init__(self):
+        self.version = SharedVersion("news_block")
+        self._lock = threading.Lock()
+        self._html = None
+        self._version = None
+        self._rendered_at = 0.0
+        self._refreshing = False
+
+    def render(self):
+        news = (
+            Posts.query.filter(Posts.type_id > 0)
+            .options(joinedload(Posts.type))
+            .order_by(Posts.rank.desc())
+            .limit(NEWS_BLOCK_SIZE)
+            .all()
+        )
+        ages = [plural_hours(int(get_hours_since(post.created_on))) for post in news]
+        return Markup(render_template("news/index_news.html", news=news, ages=ages))
+
+    def _store(self, html, version, rendered_at):
+        with self._lock:
+            if rendered_at >= self._rendered_at:
+                self._html = html
+                self._version = version
+                self._rendered_at = rendered_at
+
+    def _refresh(self, app, url_root, version):
+        started = time.monotonic()
+        try:
+            with app.test_request_context(base_url=url_root):
+                self._store(self.render(), version, started)
+        except Exception:
+            log.exception("Can't render the news block")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def get(self):
+        # The version is read first: a change during rendering is not lost
+        version = self.version.current()
+        now = time.monotonic()
+        with self._lock:
+            html = self._html
+            stale = (
+                version != self._version or now - self._rendered_at >= NEWS_BLOCK_TTL
+            )
+            refresh = html is not None and stale and not self._refreshing
+            if refresh:
+                self._refreshing = True
+
+        if html is None:
+            html = self.render()
+            self._store(html, version, now)
+        elif refresh:
+            threading.Thread(
+                target=self._refresh,
+                args=(current_app._get_current_object(), request.url_root, version),
+                name="news-block",
+                daemon=True,
+            ).start()
+        return html
+
+    def invalidate(self):
+        self.version.bump()
+
+
+news_block = NewsBlock()
+
+
+@event.listens_for(Session, "after_flush")
+def _news_block_after_flush(session, flush_context):
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, Posts):
+            session.info["se_news_block_changed"] = True
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def _news_block_after_commit(session):
+    if session.info.pop("se_news_block_changed", False):
+        news_block.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _news_block_after_rollback(session):
+    session.info.pop("se_news_block_changed", None)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import binascii
+import json
+
+from flask import abort, request
+from sqlalchemy import tuple_
+
+
+def encode_cursor(values):
+    data = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def cursor_types(column):
+    """Types a cursor value may have for the column, any JSON scalar for
+    expressions of unknown type."""
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        python_type = object
+    if python_type is int:
+        return (int,)
+    if python_type is float:
+        return (int, float)
+    if python_type is str:
+        return (str,)
+    return (str, int, float)
+
+
+def decode_cursor(cursor, columns):
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(data)
+    except (binascii.Error, ValueError):
+        abort(400)
+
+    if not isinstance(values, list) or len(values) != len(columns):
+        abort(400)
+
+    for value, column in zip(values, columns):
+        # bool is an int for isinstance()
+        if isinstance(value, bool) or not isinstance(value, cursor_types(column)):
+            abort(400)
+
+    return values
+
+
+class KeysetPage:
+    """One page of a listing ordered by columns, newest or best first.
+
+    The last column must be unique, usually the id. The next page starts
+    right after the last row of this one: WHERE (key, id) < (?, ?), which
+    an index on the key serves the same way for any page, and no COUNT(*)
+    is made. The position is passed around as an opaque cursor. total is
+    None, so templates can tell these pages from numbered ones.
+
+    Columns may be expressions, values then gives the key of a result row."""
+
+    total = None
+
+    def __init__(self, query, columns, cursor=None, per_page=20, values=None):
+        self.per_page = per_page
+
+        query = query.order_by(None).order_by(*[column.desc() for column in columns])
+        if cursor:
+            after = decode_cursor(cursor, columns)
+            query = query.filter(tuple_(*columns) < tuple(after))
+
+        # One more row tells whether there is a next page
+        rows = query.limit(per_page + 1).all()
+        self.items = rows[:per_page]
+        self.has_next = len(rows) > per_page
+
+        if self.has_next:
+            last = self.items[-1]
+            if values is None:
+                key = [getattr(last, column.key) for column in columns]
+            else:
+                key = list(values(last))
+            self.next_cursor = encode_cursor(key)
+        else:
+            self.next_cursor = None
+
+
+def paginate(query, columns, per_page=20):
+    """Numbered pages for ?page=N links, keyset pages for everything else."""
+    page = request.args.get("page", type=int)
+    if page:
+        return query.paginate(per_page=per_page, page=page, error_out=False)
+
+    return KeysetPage(query, columns, request.args.get("cursor"), per_page)
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from typing import NamedTuple, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from se_cache import SharedVersion
+from se_models import (
+    db,
+    Worktype,
+    ThesisOnReviewWorktype,
+    Courses,
+    AreasOfStudy,
+    ThemesLevel,
+    Company,
+    InternshipFormat,
+    InternshipTag,
+    PostType,
+)
+
+
+# Read-only copies of the lookup rows, str() gives the same label as the model
+class WorktypeRecord(NamedTuple):
+    id: int
+    type: str
+
+    def __str__(self):
+        return self.type
+
+
+class ThesisOnReviewWorktypeRecord(NamedTuple):
+    id: int
+    type: str
+
+    def __str__(self):
+        return self.type
+
+
+class CourseRecord(NamedTuple):
+    id: int
+    name: str
+    code: str
+
+    def __str__(self):
+        return self.name
+
+
+class AreaOfStudyRecord(NamedTuple):
+    id: int
+    area: str
+
+    def __str__(self):
+        return self.area
+
+
+class ThemesLevelRecord(NamedTuple):
+    id: int
+    level: str
+
+    def __str__(self):
+        return self.level
+
+
+class CompanyRecord(NamedTuple):
+    id: int
+    name: str
+    logo_uri: Optional[str]
+    status: Optional[int]
+
+    def __str__(self):
+        return self.name
+
+
+class InternshipFormatRecord(NamedTuple):
+    id: int
+    format: str
+
+    def __str__(self):
+        return self.format
+
+
+class InternshipTagRecord(NamedTuple):
+    id: int
+    tag: str
+
+    def __str__(self):
+        return self.tag
+
+
+class PostTypeRecord(NamedTuple):
+    id: int
+    type: int
+    name: str
+
+    def __str__(self):
+        return self.name
+
+
+RECORD_TYPES = {
+    Worktype: WorktypeRecord,
+    ThesisOnReviewWorktype: ThesisOnReviewWorktypeRecord,
+    Courses: CourseRecord,
+    AreasOfStudy: AreaOfStudyRecord,
+    ThemesLevel: ThemesLevelRecord,
+    Company: CompanyRecord,
+    InternshipFormat: InternshipFormatRecord,
+    InternshipTag: InternshipTagRecord,
+    PostType: PostTypeRecord,
+}
+
+
+class ReferenceData:
+    """Per-process cache of the small lookup tables.
+
+    Tables are loaded on first use and kept until the shared version changes,
+    i.e. until some process commits a change to any of them."""
+
+    def __init__(self):
+        self.version = SharedVersion("reference_data")
+        self._lock = threading.Lock()
+        self._loaded_version = None
+        self._tables = {}
+
+    def _table(self, model):
+        version = self.version.current()
+        with self._lock:
+            if version != self._loaded_version:
+                self._tables = {}
+                self._loaded_version = version
+
+            rows = self._tables.get(model)
+            if rows is None:
+                record_type = RECORD_TYPES[model]
+                rows = {
+                    row.id: record_type(*(getattr(row, f) for f in record_type._fields))
+                    for row in db.session.query(model).order_by(model.id)
+                }
+                self._tables[model] = rows
+            return rows
+
+    def all(self, model, first_id=None):
+        """All records ordered by id, starting from first_id if given."""
+        records = self._table(model).values()
+        if first_id is None:
+            return list(records)
+        return [r for r in records if r.id >= first_id]
+
+    def get(self, model, record_id):
+        return self._table(model).get(record_id)
+
+    def choices(self, model, first_id=None):
+        """(id, label) pairs ready for SelectField.choices."""
+        return [(r.id, str(r)) for r in self.all(model, first_id)]
+
+    def invalidate(self):
+        self.version.bump()
+
+
+reference = ReferenceData()
+
+
+@event.listens_for(Session, "after_flush")
+def _reference_after_flush(session, flush_context):
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if type(instance) in RECORD_TYPES:
+            session.info["se_reference_changed"] = True
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def _reference_after_commit(session):
+    if session.info.pop("se_reference_changed", False):
+        reference.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _reference_after_rollback(session):
+    session.info.pop("se_reference_changed", None)
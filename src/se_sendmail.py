@@ -1,85 +1,461 @@
 # -*- coding: utf-8 -*-
 
-import smtplib, ssl
+import logging
+import os
+import random
+import smtplib
+import socket
+import time
+from datetime import datetime, timedelta
+
+from flask import render_template
 
 from se_models import db, Notification, Users, DiplomaThemes
 from flask_se_config import MAIL_PASSWORD
+from se_metrics import metrics
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.header import Header
+from templates.notification.templates import NotificationTemplates
+
+log = logging.getLogger("flask_se.mail")
 
+MAIL_SERVER = "mail.spbu.ru"
+MAIL_PORT = 25
+MAIL_TIMEOUT = 30
 MAIL_DEFAULT_SENDER = "sysprog_notification@spbu.ru"
 MAIL_DEFAULT_SENDER_STRING = "SE уведомления <sysprog_notification@spbu.ru>"
 
+# Notifications claimed and finished per transaction
+MAIL_BATCH_SIZE = 100
+# A sender must finish a claimed batch within this time, otherwise the
+# notifications are given to another one
+MAIL_CLAIM_SECONDS = 300
+# Retry after 1, 2, 4... minutes, at most 6 hours apart, then give up
+MAIL_RETRY_BASE_SECONDS = 60
+MAIL_RETRY_MAX_SECONDS = 6 * 3600
+MAIL_MAX_ATTEMPTS = 10
+
+# Notification.status
+OUTBOX_PENDING = 0
+OUTBOX_DEAD = 1
+# Servers limit the number of messages per session, reconnect after that many
+MAIL_MESSAGES_PER_CONNECTION = 100
 
-def notification_send_mail():
-    notifications = Notification.query.filter_by(type=0).all()
+# Digests wait for MAIL_DIGEST_WINDOW_MINUTES, retries for hours
+MAIL_LATENCY_BUCKETS = (1, 5, 15, 60, 300, 900, 1800, 3600, 6 * 3600, 24 * 3600)
+MAIL_BATCH_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# The outbox depth is reported for notifications older than these (seconds)
+OUTBOX_AGES = (0, 60, 300, 3600, 24 * 3600)
 
-    for n in notifications:
-        user = Users.query.filter_by(id=n.recipient).first()
+metrics.describe(
+    "se_mail_notifications_total",
+    "counter",
+    "Mail notifications handled by the senders: delivered, retry or dead.",
+)
+metrics.describe(
+    "se_mail_server_errors_total",
+    "counter",
+    "Batches interrupted because the mail server was unavailable.",
+)
+metrics.describe(
+    "se_mail_delivery_latency_seconds",
+    "histogram",
+    "Time from enqueueing a notification to its delivery.",
+)
+metrics.describe(
+    "se_mail_batch_seconds", "histogram", "SMTP time spent on a claimed batch."
+)
+metrics.describe(
+    "se_mail_outbox_notifications",
+    "gauge",
+    "Notifications in the outbox by status and age (older_than, seconds).",
+)
+metrics.describe(
+    "se_mail_outbox_oldest_due_seconds",
+    "gauge",
+    "How long the oldest due notification has been waiting for a sender.",
+)
 
-        if not user:
-            continue
 
-        message = MIMEMultipart("alternative")
-        message["Subject"] = n.title
-        message["From"] = MAIL_DEFAULT_SENDER
-        message["To"] = user.email
+class SmtpSession:
+    """Authenticated SMTP connection reused for many messages.
 
-        part1 = MIMEText(n.content, "plain")
-        part2 = MIMEText(n.content, "html")
+    The connection is opened on the first send(), replaced after
+    MAIL_MESSAGES_PER_CONNECTION messages and re-established once if the
+    server drops it in the middle of a batch."""
 
-        message.attach(part1)
-        message.attach(part2)
+    def __init__(self, host=None, port=None, username=MAIL_DEFAULT_SENDER):
+        self.host = host or MAIL_SERVER
+        self.port = port or MAIL_PORT
+        self.username = username
+        self.server = None
+        self.sent_on_connection = 0
 
-        server = smtplib.SMTP("mail.spbu.ru", 25)
+    def __enter__(self):
+        return self
 
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=MAIL_TIMEOUT)
         try:
             server.ehlo()
-            server.login(MAIL_DEFAULT_SENDER, MAIL_PASSWORD)
-
-        except smtplib.SMTPHeloError:
-            print("The server didn’t reply properly to the HELO greeting.")
-        except smtplib.SMTPAuthenticationError:
-            print(
-                "The server didn’t accept the username/password combination. Username:"
-                + MAIL_DEFAULT_SENDER
-                + ", PASS:"
-                + MAIL_PASSWORD
-            )
-        except smtplib.SMTPNotSupportedError:
-            print("The AUTH command is not supported by the server.")
+            if self.username:
+                server.login(self.username, MAIL_PASSWORD)
         except smtplib.SMTPException:
-            print("No suitable authentication method was found.")
+            server.close()
+            raise
+
+        self.server = server
+        self.sent_on_connection = 0
+
+    def close(self):
+        if self.server is None:
+            return
 
         try:
-            server.sendmail(MAIL_DEFAULT_SENDER, user.email, message.as_string())
-            db.session.delete(n)
-            db.session.commit()
-
-        except smtplib.SMTPRecipientsRefused:
-            print(
-                "All recipients were refused. Nobody got the mail. User.email: {0}".format(
-                    user.email
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            self.server.close()
+        self.server = None
+
+    def send(self, to_addrs, message):
+        if self.sent_on_connection >= MAIL_MESSAGES_PER_CONNECTION:
+            self.close()
+
+        for attempt in range(2):
+            if self.server is None:
+                self.connect()
+            try:
+                self.server.sendmail(MAIL_DEFAULT_SENDER, to_addrs, message)
+                self.sent_on_connection += 1
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout):
+                # Refused recipients and other replies of the server are not
+                # caught: the connection is fine and sendmail() has reset it
+                self.server.close()
+                self.server = None
+                if attempt:
+                    raise
+                log.warning("SMTP connection lost, reconnecting")
+
+
+def build_message(title, content, recipient):
+    message = MIMEMultipart("alternative")
+    message["Subject"] = title
+    message["From"] = MAIL_DEFAULT_SENDER
+    message["To"] = recipient
+
+    part1 = MIMEText(content, "plain")
+    part2 = MIMEText(content, "html")
+
+    message.attach(part1)
+    message.attach(part2)
+    return message
+
+
+def outbox_worker_name():
+    return "%s-%d" % (socket.gethostname(), os.getpid())
+
+
+def retry_delay(attempts):
+    delay = MAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+    # Jitter spreads the retries of one failed batch
+    delay = min(delay, MAIL_RETRY_MAX_SECONDS) * random.uniform(0.8, 1.2)
+    return timedelta(seconds=delay)
+
+
+def is_permanent_failure(e):
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in e.recipients.values())
+    if isinstance(e, smtplib.SMTPResponseException):
+        return e.smtp_code >= 500
+    return isinstance(e, smtplib.SMTPNotSupportedError)
+
+
+def claim_notifications(worker, batch_size=MAIL_BATCH_SIZE):
+    """Lease up to batch_size due mail notifications to the worker and return
+    them with the recipient address. A lease which is not released within
+    MAIL_CLAIM_SECONDS (the sender died) expires and the notifications become
+    due again. Uses the (status, next_attempt_at) index, so a poll costs
+    O(batch_size) whatever the size of the table."""
+    now = datetime.utcnow()
+    claimable = db.or_(
+        Notification.claimed_until.is_(None), Notification.claimed_until < now
+    )
+    ids = [
+        row.id
+        for row in db.session.query(Notification.id)
+        .filter(
+            Notification.status == OUTBOX_PENDING,
+            Notification.next_attempt_at <= now,
+            Notification.type == 0,
+            claimable,
+        )
+        .order_by(Notification.next_attempt_at)
+        .limit(batch_size)
+    ]
+    if not ids:
+        db.session.commit()
+        return []
+
+    # Another sender may have claimed some of them in the meantime
+    until = now + timedelta(seconds=MAIL_CLAIM_SECONDS)
+    Notification.query.filter(Notification.id.in_(ids), claimable).update(
+        {"claimed_by": worker, "claimed_until": until}, synchronize_session=False
+    )
+    db.session.commit()
+
+    return (
+        db.session.query(
+            Notification.id,
+            Notification.title,
+            Notification.content,
+            Notification.attempts,
+            Notification.created_at,
+            Notification.recipient,
+            Notification.digest,
+            Users.email,
+        )
+        .outerjoin(Users, Users.id == Notification.recipient)
+        .filter(
+            Notification.id.in_(ids),
+            Notification.claimed_by == worker,
+            Notification.claimed_until == until,
+        )
+        .order_by(Notification.id)
+        .all()
+    )
+
+
+def finish_batch(batch, delivered, failed, smtp_seconds=None):
+    """Delete delivered notifications, schedule a retry (or give up) for the
+    failed ones and release the rest, all in one transaction.
+    failed is a list of (notification, error, permanent)."""
+    now = datetime.utcnow()
+    if delivered:
+        Notification.query.filter(Notification.id.in_(delivered)).delete(
+            synchronize_session=False
+        )
+
+    dead_count = 0
+    if failed:
+        updates = []
+        for n, error, permanent in failed:
+            attempts = n.attempts + 1
+            dead = permanent or attempts >= MAIL_MAX_ATTEMPTS
+            updates.append(
+                {
+                    "id": n.id,
+                    "status": OUTBOX_DEAD if dead else OUTBOX_PENDING,
+                    "attempts": attempts,
+                    "next_attempt_at": now + retry_delay(attempts),
+                    "last_error": str(error)[:512],
+                    "claimed_by": None,
+                    "claimed_until": None,
+                }
+            )
+            if dead:
+                dead_count += 1
+                log.warning(
+                    "mail notification dead id=%d recipient=%d attempts=%d error=%s",
+                    n.id,
+                    n.recipient,
+                    attempts,
+                    error,
                 )
+        db.session.execute(db.update(Notification), updates)
+
+    done = set(delivered) | {n.id for n, _, _ in failed}
+    rest = [n.id for n in batch if n.id not in done]
+    if rest:
+        Notification.query.filter(Notification.id.in_(rest)).update(
+            {"claimed_by": None, "claimed_until": None}, synchronize_session=False
+        )
+
+    db.session.commit()
+    record_batch(batch, delivered, len(failed) - dead_count, dead_count, smtp_seconds)
+
+
+def record_batch(batch, delivered, retry, dead, smtp_seconds):
+    now = datetime.utcnow()
+    delivered = set(delivered)
+    for n in batch:
+        if n.id in delivered:
+            metrics.observe(
+                "se_mail_delivery_latency_seconds",
+                (now - n.created_at).total_seconds(),
+                buckets=MAIL_LATENCY_BUCKETS,
+                digest=str(bool(n.digest)).lower(),
             )
-        except smtplib.SMTPDataError:
-            print("The server didn’t accept the from_addr.")
-        except smtplib.SMTPSenderRefused:
-            print("The server didn’t accept the from_addr.")
-        except smtplib.SMTPNotSupportedError:
-            print(
-                "SMTPUTF8 was given in the mail_options but is not supported by the server."
+
+    metrics.inc("se_mail_notifications_total", len(delivered), result="delivered")
+    metrics.inc("se_mail_notifications_total", retry, result="retry")
+    metrics.inc("se_mail_notifications_total", dead, result="dead")
+    if smtp_seconds is not None:
+        metrics.observe(
+            "se_mail_batch_seconds", smtp_seconds, buckets=MAIL_BATCH_BUCKETS
+        )
+
+    log.info(
+        "mail batch size=%d delivered=%d retry=%d dead=%d released=%d smtp_time=%.3f",
+        len(batch),
+        len(delivered),
+        retry,
+        dead,
+        len(batch) - len(delivered) - retry - dead,
+        smtp_seconds or 0.0,
+    )
+    # The mail dispatcher serves no requests, which flush the other processes
+    metrics.flush()
+
+
+def record_server_error(host, port, error):
+    metrics.inc("se_mail_server_errors_total")
+    # Server responses only, the password never gets into an SMTP exception
+    log.error("mail server unavailable host=%s port=%d error=%s", host, port, error)
+
+
+def outbox_metrics():
+    """Outbox depth by age and the wait of the oldest due notification, read
+    from the database on every scrape."""
+    now = datetime.utcnow()
+    columns = [
+        db.func.sum(
+            db.case(
+                (Notification.created_at <= now - timedelta(seconds=age), 1), else_=0
             )
+        )
+        for age in OUTBOX_AGES
+    ]
+    depth = {status: [0] * len(OUTBOX_AGES) for status in (OUTBOX_PENDING, OUTBOX_DEAD)}
+    for status, *counts in (
+        db.session.query(Notification.status, *columns)
+        .filter(Notification.type == 0)
+        .group_by(Notification.status)
+    ):
+        depth[status] = [count or 0 for count in counts]
+
+    for status, counts in depth.items():
+        name = "dead" if status == OUTBOX_DEAD else "pending"
+        for age, count in zip(OUTBOX_AGES, counts):
+            yield "se_mail_outbox_notifications", {
+                "status": name,
+                "older_than": age,
+            }, count
+
+    oldest_due = (
+        db.session.query(db.func.min(Notification.next_attempt_at))
+        .filter(
+            Notification.status == OUTBOX_PENDING,
+            Notification.next_attempt_at <= now,
+            Notification.type == 0,
+        )
+        .scalar()
+    )
+    waiting = (now - oldest_due).total_seconds() if oldest_due else 0
+    yield "se_mail_outbox_oldest_due_seconds", {}, waiting
+
+
+def group_digests(batch):
+    """Split a claimed batch into messages: digest notifications of one
+    recipient go together, any other notification is a message on its own."""
+    groups = []
+    digests = {}
+    for n in batch:
+        if not n.digest:
+            groups.append([n])
+        elif n.recipient in digests:
+            digests[n.recipient].append(n)
+        else:
+            digests[n.recipient] = [n]
+            groups.append(digests[n.recipient])
+    return groups
+
+
+def compose_message(group):
+    if len(group) == 1:
+        return group[0].title, group[0].content
+
+    title = "[SE site] Уведомления ({0})".format(len(group))
+    content = render_template(NotificationTemplates.DIGEST.value, notifications=group)
+    return title, content
+
+
+def prepare_message(group):
+    """Recipient address and message text for a group of notifications, None
+    if the recipient has no address. Needs the app context for digests."""
+    email = group[0].email
+    if not email:
+        return None
+    return email, build_message(*compose_message(group), email).as_string()
+
+
+def send_prepared(session, group, prepared):
+    """Send one prepared message, returns (delivered ids, failed, server
+    error). On a server error the message attempt is counted, the caller
+    should stop and leave the rest for later."""
+    if prepared is None:
+        return [], [(n, "Recipient has no email", True) for n in group], None
+
+    email, message = prepared
+    try:
+        session.send(email, message)
+        return [n.id for n in group], [], None
+    except (
+        smtplib.SMTPRecipientsRefused,
+        smtplib.SMTPDataError,
+        smtplib.SMTPSenderRefused,
+        smtplib.SMTPNotSupportedError,
+    ) as e:
+        permanent = is_permanent_failure(e)
+        return [], [(n, e, permanent) for n in group], None
+    except (smtplib.SMTPException, OSError) as e:
+        # Authentication failed or the server is down
+        return [], [(n, e, False) for n in group], e
+
+
+def notification_send_mail(batch_size=MAIL_BATCH_SIZE, host=None, port=None):
+    """Send due mail notifications over one SMTP session, one claimed batch
+    and one transaction at a time. Returns the number sent."""
+    worker = outbox_worker_name()
+    sent = 0
+
+    with SmtpSession(host, port) as session:
+        while True:
+            batch = claim_notifications(worker, batch_size)
+            if not batch:
+                break
+
+            started = time.perf_counter()
+            delivered = []
+            failed = []
+            server_error = None
+            for group in group_digests(batch):
+                group_delivered, group_failed, server_error = send_prepared(
+                    session, group, prepare_message(group)
+                )
+                delivered.extend(group_delivered)
+                failed.extend(group_failed)
+                if server_error is not None:
+                    break
+
+            finish_batch(batch, delivered, failed, time.perf_counter() - started)
+            sent += len(delivered)
+
+            if server_error is not None:
+                record_server_error(session.host, session.port, server_error)
+                break
+
+    return sent
 
 
 def notification_send_diploma_themes_on_review():
     diploma_themes_on_review_count = DiplomaThemes.query.filter_by(status=0).count()
 
-    print(
-        "Invoke notification_send_diploma_themes_on_review = "
-        + str(diploma_themes_on_review_count)
-    )
+    log.info("Diploma themes on review: %d", diploma_themes_on_review_count)
 
     if not diploma_themes_on_review_count:
         return
@@ -91,53 +467,21 @@ def notification_send_diploma_themes_on_review():
         "stanislav.sartasov@gmail.com",
     ]
 
-    message = MIMEMultipart("alternative")
-    message["Subject"] = "[SE site] Есть неодобренные темы учебных практик и ВКР"
-    message["From"] = MAIL_DEFAULT_SENDER
-    message["To"] = "ilya@hackerdom.ru"
-    message["CC"] = ", ".join(recipients)
-
     data = """
     Сейчас на сайте {0} тем находятся на проверке (<a href="https://se.math.spbu.ru/admin/reviewdiplomathemes/" target="_blank">Проверка тем</a>).
     """.format(
         diploma_themes_on_review_count
     )
 
-    part1 = MIMEText(data, "plain")
-    part2 = MIMEText(data, "html")
-    message.attach(part1)
-    message.attach(part2)
-
-    server = smtplib.SMTP("mail.spbu.ru", 25)
-
-    try:
-        server.ehlo()
-        server.login(MAIL_DEFAULT_SENDER, MAIL_PASSWORD)
-
-    except smtplib.SMTPHeloError:
-        print("The server didn’t reply properly to the HELO greeting.")
-    except smtplib.SMTPAuthenticationError:
-        print(
-            "The server didn’t accept the username/password combination. Username:"
-            + MAIL_DEFAULT_SENDER
-            + ", PASS:"
-            + MAIL_PASSWORD
-        )
-    except smtplib.SMTPNotSupportedError:
-        print("The AUTH command is not supported by the server.")
-    except smtplib.SMTPException:
-        print("No suitable authentication method was found.")
+    message = build_message(
+        "[SE site] Есть неодобренные темы учебных практик и ВКР",
+        data,
+        "ilya@hackerdom.ru",
+    )
+    message["CC"] = ", ".join(recipients)
 
     try:
-        server.sendmail(MAIL_DEFAULT_SENDER, recipients, message.as_string())
-
-    except smtplib.SMTPRecipientsRefused:
-        print("All recipients were refused. Nobody got the mail.")
-    except smtplib.SMTPDataError:
-        print("The server didn’t accept the from_addr.")
-    except smtplib.SMTPSenderRefused:
-        print("The server didn’t accept the from_addr.")
-    except smtplib.SMTPNotSupportedError:
-        print(
-            "SMTPUTF8 was given in the mail_options but is not supported by the server."
-        )
+        with SmtpSession() as session:
+            session.send(recipients, message.as_string())
+    except (smtplib.SMTPException, OSError) as e:
+        log.error("Can't send diploma themes notification: %s", e)
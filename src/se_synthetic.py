@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from flask_se_config import post_ranking_score, get_hours_since
+from se_models import (
+    db,
+    search,
+    bulk_insert,
+    Users,
+    Staff,
+    Thesis,
+    Worktype,
+    Courses,
+    AreasOfStudy,
+    Posts,
+    PostType,
+    PostVote,
+    Notification,
+    NotificationPractice,
+    CurrentThesis,
+    ThesisTask,
+    ThesisReport,
+)
+
+log = logging.getLogger("flask_se.synthetic")
+
+# Every fake user can log in with this password
+SYNTHETIC_PASSWORD = "synthetic"
+
+WORDS = (
+    "анализ алгоритм архитектура база данных выбор граф данные задача значение "
+    "интерфейс исследование использование качество класс код компилятор "
+    "компонент контекст критерий метод модель модуль нагрузка область обработка "
+    "обучение объект ограничение оптимизация оценка память параметр платформа "
+    "подход поиск поток представление приложение программа проверка проект "
+    "производительность процесс работа разработка распределённый реализация "
+    "результат решение сеть система сложность состояние среда статический "
+    "структура сервис тестирование тип транслятор узел управление устройство "
+    "файл формат функция хранилище целевой цикл эксперимент язык"
+).split()
+
+FIRST_NAMES = (
+    "Александр Алексей Анна Андрей Дарья Дмитрий Екатерина Елена Иван Илья "
+    "Кирилл Мария Михаил Никита Ольга Павел Полина Сергей Софья Татьяна"
+).split()
+LAST_NAMES = (
+    "Иванов Смирнов Кузнецов Попов Васильев Петров Соколов Михайлов Новиков "
+    "Фёдоров Морозов Волков Алексеев Лебедев Семёнов Егоров Павлов Козлов"
+).split()
+MIDDLE_NAMES = (
+    "Александрович Алексеевич Андреевич Дмитриевич Иванович Михайлович "
+    "Николаевич Сергеевич Владимирович Юрьевич"
+).split()
+
+# Share of users that are staff, have a practice thesis, voted for a post
+STAFF_SHARE = 0.05
+PRACTICE_SHARE = 0.4
+VOTER_SHARE = 0.6
+VOTES_PER_VOTER = 5
+
+
+def _words(rnd, count):
+    return " ".join(rnd.choice(WORDS) for _ in range(count))
+
+
+def _sentence(rnd, low, high):
+    return _words(rnd, rnd.randint(low, high)).capitalize()
+
+
+def _text(rnd, words_median):
+    # Lengths of real texts are close to lognormal: most are near the median,
+    # a few are several times longer
+    count = max(1, int(rnd.lognormvariate(0, 0.6) * words_median))
+    return ". ".join(_sentence(rnd, 6, 18) for _ in range(max(1, count // 12))) + "."
+
+
+def _pareto_weights(rnd, count, alpha=1.2):
+    # A few staff members supervise many students, a few posts get most votes
+    return [rnd.paretovariate(alpha) for _ in range(count)]
+
+
+def generate_synthetic_data(users=1000, seed=0, thesis_words=2000):
+    """Add `users` fake users to the database and the content they would
+    produce: theses with text, news, votes, mail notifications, practice
+    theses with tasks and reports. Everything goes in one transaction.
+
+    Reference tables (worktypes, courses, areas, post types) must be filled
+    already, i.e. run `python flask_se.py init` first."""
+
+    rnd = random.Random(seed)
+    now = datetime.utcnow()
+    started = time.monotonic()
+
+    worktype_ids = [w.id for w in Worktype.query.filter(Worktype.id > 1)]
+    course_ids = [c.id for c in Courses.query]
+    area_ids = [a.id for a in AreasOfStudy.query.filter(AreasOfStudy.id > 1)]
+    post_type_ids = [p.id for p in PostType.query]
+    if not worktype_ids or not course_ids or not area_ids:
+        raise RuntimeError("Reference tables are empty, run init first")
+    if not post_type_ids:
+        post_type_ids = bulk_insert(PostType, [{"type": 1, "name": "Новости"}])
+
+    # Users: hashing is deliberately slow, all fake users share one hash
+    password_hash = generate_password_hash(SYNTHETIC_PASSWORD)
+    first_user = (db.session.query(db.func.max(Users.id)).scalar() or 0) + 1
+    user_rows = []
+    for i in range(users):
+        user_rows.append(
+            {
+                "email": "synthetic%d@example.com" % (first_user + i),
+                "password_hash": password_hash,
+                "first_name": rnd.choice(FIRST_NAMES),
+                "middle_name": rnd.choice(MIDDLE_NAMES),
+                "last_name": rnd.choice(LAST_NAMES),
+                "avatar_uri": "empty.jpg",
+                "role": 0,
+            }
+        )
+    user_ids = bulk_insert(Users, user_rows)
+
+    staff_count = max(1, int(users * STAFF_SHARE))
+    staff_users = rnd.sample(user_ids, staff_count)
+    staff_ids = bulk_insert(
+        Staff,
+        [
+            {
+                "user_id": user_id,
+                "official_email": "staff%d@example.com" % user_id,
+                "position": rnd.choice(["Доцент", "Профессор", "Ассистент"]),
+                "science_degree": rnd.choice([None, "к.ф.-м.н.", "д.ф.-м.н."]),
+                "still_working": rnd.random() < 0.8,
+            }
+            for user_id in staff_users
+        ],
+    )
+    staff_weights = _pareto_weights(rnd, len(staff_ids))
+    students = sorted(set(user_ids) - set(staff_users))
+    names = {user_ids[i]: row for i, row in enumerate(user_rows)}
+
+    # Theses: the number defended grows year by year
+    first_year = 2007
+    years = list(range(first_year, now.year + 1))
+    year_weights = [1 + (year - first_year) for year in years]
+    thesis_rows = []
+    for _ in range(users // 2):
+        author_id = rnd.choice(students) if students else None
+        author = names[author_id] if author_id else user_rows[0]
+        thesis_rows.append(
+            {
+                "type_id": rnd.choice(worktype_ids),
+                "course_id": rnd.choice(course_ids),
+                "area_id": rnd.choice(area_ids),
+                "name_ru": _sentence(rnd, 4, 12),
+                "description": _text(rnd, 60),
+                "author": "%s %s" % (author["first_name"], author["last_name"]),
+                "author_id": author_id,
+                "supervisor_id": rnd.choices(staff_ids, staff_weights)[0],
+                "reviewer_id": rnd.choice(staff_ids),
+                "publish_year": rnd.choices(years, year_weights)[0],
+                "recomended": rnd.random() < 0.1,
+                "temporary": False,
+                "text": _text(rnd, thesis_words),
+                "download_thesis": int(rnd.lognormvariate(2, 1.2)),
+                "download_presentation": int(rnd.lognormvariate(1, 1.2)),
+            }
+        )
+    bulk_insert(Thesis, thesis_rows)
+    del thesis_rows
+
+    # News: recent posts are the majority, views and votes are heavy tailed
+    post_rows = []
+    for _ in range(users // 5):
+        created_on = now - timedelta(hours=rnd.expovariate(1 / (60 * 24)))
+        post_rows.append(
+            {
+                "title": _sentence(rnd, 3, 10),
+                "uri": None,
+                "domain": None,
+                "text": _text(rnd, 80)[:4096],
+                "votes": 1,
+                "views": 1 + int(rnd.lognormvariate(3, 1.2)),
+                "created_on": created_on,
+                "updated_on": created_on,
+                "rank": 0.0,
+                "author_id": rnd.choice(user_ids),
+                "type_id": rnd.choice(post_type_ids),
+            }
+        )
+    post_ids = bulk_insert(Posts, post_rows)
+
+    # Voters vote for a few posts each, popular ones more often
+    vote_rows = []
+    if post_ids and user_ids:
+        post_weights = _pareto_weights(rnd, len(post_ids))
+        voters = rnd.sample(user_ids, int(len(user_ids) * VOTER_SHARE))
+        for user_id in voters:
+            chosen = rnd.choices(
+                range(len(post_ids)), post_weights, k=rnd.randint(1, VOTES_PER_VOTER)
+            )
+            for index in set(chosen):
+                upvote = rnd.random() < 0.85
+                post_rows[index]["votes"] += 1 if upvote else -1
+                vote_rows.append(
+                    {"user_id": user_id, "post_id": post_ids[index], "upvote": upvote}
+                )
+        if vote_rows:
+            db.session.execute(db.insert(PostVote), vote_rows)
+
+    # Ranks as recalculate_post_rank() would set them
+    if post_ids:
+        db.session.execute(
+            db.update(Posts),
+            [
+                {
+                    "id": post_id,
+                    "votes": row["votes"],
+                    "rank": post_ranking_score(
+                        max(row["votes"], 0),
+                        get_hours_since(row["created_on"]),
+                        row["views"],
+                    ),
+                }
+                for post_id, row in zip(post_ids, post_rows)
+            ],
+        )
+    del post_rows
+
+    # Practice theses: most are active, status 2 is a finished one
+    practice_rows = []
+    practice_authors = rnd.sample(students, int(len(students) * PRACTICE_SHARE))
+    for author_id in practice_authors:
+        practice_rows.append(
+            {
+                "author_id": author_id,
+                "area_id": rnd.choice(area_ids),
+                "worktype_id": rnd.choice(worktype_ids),
+                "title": _sentence(rnd, 4, 12),
+                "supervisor_id": rnd.choices(staff_ids, staff_weights)[0],
+                "goal": _sentence(rnd, 8, 20),
+                "archived": False,
+                "deleted": rnd.random() < 0.02,
+                "status": 1 if rnd.random() < 0.7 else 2,
+            }
+        )
+    practice_ids = bulk_insert(CurrentThesis, practice_rows)
+
+    task_rows = []
+    report_rows = []
+    for practice_id, row in zip(practice_ids, practice_rows):
+        for _ in range(rnd.randint(2, 5)):
+            task_rows.append(
+                {
+                    "task_text": _sentence(rnd, 5, 15),
+                    "deleted": False,
+                    "current_thesis_id": practice_id,
+                }
+            )
+        # Reports per practice are geometric with mean 4, weekly apart
+        report_time = now - timedelta(days=rnd.randint(0, 365))
+        while rnd.random() < 0.8:
+            commented = rnd.random() < 0.5
+            report_rows.append(
+                {
+                    "author_id": row["author_id"],
+                    "current_thesis_id": practice_id,
+                    "was_done": _text(rnd, 40)[:2048],
+                    "planned_to_do": _text(rnd, 30)[:2048],
+                    "time": report_time,
+                    "deleted": False,
+                    "comment": _sentence(rnd, 5, 20) if commented else None,
+                    "comment_time": report_time + timedelta(days=1)
+                    if commented
+                    else None,
+                }
+            )
+            report_time -= timedelta(days=7)
+    bulk_insert(ThesisTask, task_rows)
+    bulk_insert(ThesisReport, report_rows)
+
+    # Notifications: about three per practice, most already seen, and a
+    # backlog of mail waiting to be sent
+    practice_notification_rows = []
+    for row in practice_rows:
+        for _ in range(int(rnd.expovariate(1 / 3))):
+            practice_notification_rows.append(
+                {
+                    "recipient_id": row["author_id"],
+                    "content": _sentence(rnd, 5, 15),
+                    "time": now - timedelta(hours=rnd.expovariate(1 / (24 * 30))),
+                    "viewed": rnd.random() < 0.8,
+                }
+            )
+    bulk_insert(NotificationPractice, practice_notification_rows)
+    bulk_insert(
+        Notification,
+        [
+            {
+                "type": 0,
+                "recipient": rnd.choice(user_ids),
+                "title": _sentence(rnd, 3, 8),
+                "content": _text(rnd, 60),
+            }
+            for _ in range(users // 20)
+        ],
+    )
+
+    db.session.commit()
+    log.info(
+        "generated %d users, %d theses, %d posts, %d votes, %d practices, "
+        "%d reports in %.1fs",
+        users,
+        users // 2,
+        len(post_ids),
+        len(vote_rows),
+        len(practice_ids),
+        len(report_rows),
+        time.monotonic() - started,
+    )
+
+    search.update_index()
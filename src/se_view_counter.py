@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+import atexit
+import logging
+import threading
+import time
+
+from se_metrics import metrics
+from se_models import db, Posts, refresh_post_ranks
+from se_news_block import news_block
+
+log = logging.getLogger("flask_se.views")
+
+# Views are written to the database at most this often per process
+VIEW_FLUSH_INTERVAL = 10
+
+metrics.describe(
+    "se_news_views_unflushed",
+    "gauge",
+    "Post views counted by the web workers and not yet written to the database.",
+)
+metrics.describe(
+    "se_news_views_flushed_total", "counter", "Post views written to the database."
+)
+
+
+class ViewCounter:
+    """Write-behind counter of post views.
+
+    Views are summed up per post in memory and written every
+    VIEW_FLUSH_INTERVAL seconds as one transaction: an executemany of
+    UPDATE posts SET views = views + ? and the new ranks of those posts and
+    of the posts voted for meanwhile. Counts of a failed flush are kept for
+    the next one, the rest are written when the process exits."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._stale_ranks = set()
+        self._flushed_at = time.monotonic()
+        self.app = None
+
+    def add(self, post_id):
+        with self._lock:
+            self._pending[post_id] = self._pending.get(post_id, 0) + 1
+            unflushed = sum(self._pending.values())
+        metrics.set("se_news_views_unflushed", unflushed)
+
+    def refresh_rank(self, post_id):
+        with self._lock:
+            self._stale_ranks.add(post_id)
+
+    def flush(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if not self._pending and not self._stale_ranks:
+                return
+            if not force and now - self._flushed_at < VIEW_FLUSH_INTERVAL:
+                return
+            self._flushed_at = now
+            pending, self._pending = self._pending, {}
+            stale_ranks, self._stale_ranks = self._stale_ranks, set()
+
+        try:
+            # Its own transaction, whatever the request left in db.session
+            with db.engine.begin() as connection:
+                if pending:
+                    connection.execute(
+                        db.update(Posts.__table__)
+                        .where(Posts.id == db.bindparam("post_id"))
+                        .values(views=Posts.views + db.bindparam("post_views")),
+                        [
+                            {"post_id": post_id, "post_views": views}
+                            for post_id, views in pending.items()
+                        ],
+                    )
+                refresh_post_ranks(connection, list(stale_ranks | set(pending)))
+        except Exception:
+            log.exception("Can't write %d post views", sum(pending.values()))
+            with self._lock:
+                for post_id, views in pending.items():
+                    self._pending[post_id] = self._pending.get(post_id, 0) + views
+                self._stale_ranks |= stale_ranks
+        else:
+            metrics.inc("se_news_views_flushed_total", sum(pending.values()))
+            if stale_ranks:
+                # Votes reorder the homepage news, views alone wait for its TTL
+                news_block.invalidate()
+
+        with self._lock:
+            unflushed = sum(self._pending.values())
+        metrics.set("se_news_views_unflushed", unflushed)
+
+    def _flush_on_exit(self):
+        with self.app.app_context():
+            self.flush(force=True)
+
+    def _teardown_request(self, exc):
+        self.flush()
+
+    def init_app(self, app):
+        self.app = app
+        app.teardown_request(self._teardown_request)
+        atexit.register(self._flush_on_exit)
+        try:
+            import uwsgi
+        except ImportError:
+            return
+        # uWSGI workers may exit without running atexit handlers. uWSGI has a
+        # single hook: one set before is called after the flush, one set
+        # later must call this one in the same way.
+        previous = getattr(uwsgi, "atexit", None)
+
+        def flush_on_uwsgi_exit():
+            self._flush_on_exit()
+            if previous is not None:
+                previous()
+
+        uwsgi.atexit = flush_on_uwsgi_exit
+
+
+view_counter = ViewCounter()
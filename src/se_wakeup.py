@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import os
+import select
+import socket
+
+from flask_se_config import SQLITE_DATABASE_PATH
+
+log = logging.getLogger("flask_se.wakeup")
+
+
+class Wakeup:
+    """Local wakeup channel: a datagram Unix socket databases/<name>.sock.
+
+    Any process on the host calls notify() after it has committed new work,
+    the one process which listen()s wakes up at once instead of waiting for
+    its next poll. Wakeups are hints: if nobody listens or one is already
+    queued they are dropped, so the listener must still poll now and then."""
+
+    def __init__(self, name):
+        self.name = name
+        self.path = os.path.join(SQLITE_DATABASE_PATH, name + ".sock")
+        self._sock = None
+
+    def notify(self):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+                sock.setblocking(False)
+                sock.sendto(b"\0", self.path)
+        except OSError:
+            # No listener or its queue is full, it will be woken anyway
+            pass
+
+    def listen(self):
+        # A socket file left by a killed listener refuses bind(). A live
+        # listener loses its wakeups to the new one and falls back to polling.
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        sock.bind(self.path)
+        self._sock = sock
+        log.info("listening for %s wakeups on %s", self.name, self.path)
+        return self
+
+    def close(self):
+        if self._sock is None:
+            return
+
+        self._sock.close()
+        self._sock = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def _drain(self):
+        # Many notifications before the listener got to work are one wakeup
+        while True:
+            try:
+                self._sock.recv(64)
+            except (BlockingIOError, InterruptedError):
+                return
+
+    def wait(self, timeout):
+        """Block until notified or timeout seconds passed, True if notified."""
+        readable, _, _ = select.select([self._sock], [], [], timeout)
+        self._drain()
+        return bool(readable)
+
+    async def wait_async(self, timeout):
+        loop = asyncio.get_running_loop()
+        woken = loop.create_future()
+
+        def on_readable():
+            if not woken.done():
+                woken.set_result(True)
+
+        loop.add_reader(self._sock.fileno(), on_readable)
+        try:
+            return await asyncio.wait_for(woken, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            loop.remove_reader(self._sock.fileno())
+            self._drain()
+
+
+# New mail notifications, see se_mail_dispatcher
+mail_wakeup = Wakeup("mail")
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""Background worker, runs the scheduled jobs outside of the web workers.
+
+    python se_worker.py                  # scheduled jobs
+    python se_worker.py mail_dispatcher  # concurrent mail sender
+
+The worker has its own small app: database and templates, no views, admin or
+search index, so it starts fast and the web workers do not carry it."""
+
+import logging
+import sys
+import threading
+from functools import wraps
+
+from flask import Flask
+from flask_apscheduler import APScheduler
+
+from flask_se_config import SQLITE_DATABASE_NAME, SQLITE_DATABASE_PATH
+from se_leader import LeaderElection
+from se_models import db, recalculate_post_rank
+from se_sendmail import (
+    notification_send_mail,
+    notification_send_diploma_themes_on_review,
+)
+from se_wakeup import mail_wakeup
+
+log = logging.getLogger("flask_se.worker")
+
+# Job registry: id -> (function, interval in seconds)
+JOBS = {}
+
+
+def job(job_id, seconds):
+    def decorator(func):
+        JOBS[job_id] = (func, seconds)
+        return func
+
+    return decorator
+
+
+@job("RecalculatePostRank", seconds=3600)
+def recalculate_post_rank_job():
+    recalculate_post_rank()
+
+
+# Enqueued notifications wake the job up, polling is a safety net for missed
+# wakeups, digests and retries
+@job("SendMailNotification", seconds=60)
+def notification_send_mail_job():
+    notification_send_mail()
+
+
+@job("SendDiplomaThemesOnReviewNotification", seconds=86400)
+def notification_send_diploma_themes_on_review_job():
+    notification_send_diploma_themes_on_review()
+
+
+def create_worker_app():
+    app = Flask(
+        "flask_se",
+        template_folder="templates",
+        instance_path=SQLITE_DATABASE_PATH,
+    )
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + SQLITE_DATABASE_NAME
+    app.config["SCHEDULER_TIMEZONE"] = "UTC"
+    db.init_app(app)
+    # flask_se.* loggers write through the app logger
+    app.logger.setLevel(logging.INFO)
+    return app
+
+
+def in_app_context(app, func):
+    @wraps(func)
+    def wrapper():
+        with app.app_context():
+            func()
+
+    return wrapper
+
+
+class Worker:
+    def __init__(self, app):
+        self.app = app
+        self.scheduler = APScheduler(app=app)
+        for job_id, (func, seconds) in JOBS.items():
+            self.scheduler.add_job(
+                id=job_id,
+                func=in_app_context(app, func),
+                trigger="interval",
+                seconds=seconds,
+            )
+        # Several workers may run, e.g. during a deploy, only one runs the jobs
+        self.leader = LeaderElection(
+            "scheduler", on_elected=self.start, describe=self.describe
+        )
+
+    def describe(self):
+        return {
+            "jobs": [
+                {
+                    "id": job.id,
+                    "next_run_time": job.next_run_time.isoformat()
+                    if job.next_run_time
+                    else None,
+                }
+                for job in self.scheduler.get_jobs()
+            ]
+        }
+
+    def start(self):
+        self.scheduler.start()
+        threading.Thread(
+            target=self.listen_mail_wakeups, name="mail-wakeup", daemon=True
+        ).start()
+
+    def listen_mail_wakeups(self):
+        # Wakeups which come while sending are queued and start the next round
+        send_mail = in_app_context(self.app, notification_send_mail_job)
+        mail_wakeup.listen()
+        while True:
+            if mail_wakeup.wait(timeout=None):
+                try:
+                    send_mail()
+                except Exception:
+                    log.exception("Can't send mail notifications")
+
+    def run(self):
+        self.leader.start()
+        log.info("Worker started, jobs: %s", ", ".join(JOBS))
+        threading.Event().wait()
+
+
+if __name__ == "__main__":
+    worker_app = create_worker_app()
+    if len(sys.argv) > 1 and sys.argv[1] == "mail_dispatcher":
+        from se_mail_dispatcher import run_mail_dispatcher
+
+        run_mail_dispatcher(worker_app)
+    else:
+        Worker(worker_app).run()
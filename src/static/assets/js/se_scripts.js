@@ -290,6 +290,35 @@ if (thesis_search_filter)
 }
 
 
+// Show the number of results next to every filter option and disable
+// options leading to an empty page
+function facets_update(url, params) {
+
+    fetch(url + '?' + params.toString()).then(function(response){
+
+        if (response.ok){
+            response.json().then(function (counts) {
+                for (let facet in counts){
+                    let select = document.getElementById(facet);
+                    if (!select){
+                        continue;
+                    }
+
+                    for (let option of select.options){
+                        if (option.dataset.label === undefined){
+                            option.dataset.label = option.text;
+                        }
+                        let count = counts[facet][option.value] || 0;
+                        option.text = option.dataset.label + ' (' + count + ')';
+                        option.disabled = (count == 0 && !option.selected);
+                    }
+                }
+            });
+        }
+    });
+}
+
+
 function themes_load() {
 
     let themes_list = document.getElementById('ThemesList');
@@ -297,6 +326,7 @@ function themes_load() {
     let themes_level_select = document.getElementById('level');
     let themes_supervisor_select = document.getElementById('supervisor');
     let themes_company_select = document.getElementById('company');
+    let themes_search_field = document.getElementById('themes_search_field');
 
     // Get fileters from URI
     let url_string = window.location.href
@@ -325,6 +355,13 @@ function themes_load() {
         params.append('company', themes_company_select.value);
     }
 
+    // Keywords?
+    if (themes_search_field && themes_search_field.value){
+        params.append('search', themes_search_field.value);
+    }
+
+    facets_update('fetch_themes_facets', params);
+
     fetch('fetch_themes?' + params.toString()).then(function(response){
 
         if (!response.ok){
@@ -345,6 +382,7 @@ function themes_update() {
     let themes_level_select = document.getElementById('level');
     let themes_supervisor_select = document.getElementById('supervisor');
     let themes_company_select = document.getElementById('company');
+    let themes_search_field = document.getElementById('themes_search_field');
 
     // Get fileters from URI
     let url_string = window.location.href
@@ -353,11 +391,6 @@ function themes_update() {
 
     let params = new URLSearchParams();
 
-    // Page first
-    if (page && page > 1){
-        params.append('page', 1);
-    }
-
     // Supervisor?
     if (themes_supervisor_select){
         params.append('supervisor', themes_supervisor_select.value);
@@ -373,12 +406,19 @@ function themes_update() {
         params.append('company', themes_company_select.value);
     }
 
+    // Keywords?
+    if (themes_search_field && themes_search_field.value){
+        params.append('search', themes_search_field.value);
+    }
+
     if (Array.from(params).length){
         window.history.pushState("", "", 'index.html?' + params.toString());
     } else {
         window.history.pushState("", "", 'index.html');
     }
 
+    facets_update('fetch_themes_facets', params);
+
     fetch('fetch_themes?' + params.toString()).then(function(response){
 
         if (!response.ok){
@@ -398,6 +438,7 @@ function diploma_themes_filter()
     let themes_level_select = document.getElementById('level');
     let themes_supervisor_select = document.getElementById('supervisor');
     let themes_company_select = document.getElementById('company');
+    let themes_search_field = document.getElementById('themes_search_field');
 
     // Get fileters from URI
     let url_string = window.location.href
@@ -407,6 +448,11 @@ function diploma_themes_filter()
     let page = url.searchParams.get("page");
     let supervisor = url.searchParams.get("supervisor");
     let company = url.searchParams.get("company");
+    let search = url.searchParams.get("search");
+
+    if (themes_search_field && search){
+        themes_search_field.value = search;
+    }
 
     if (themes_level_select)
     {
@@ -443,6 +489,9 @@ function diploma_themes_filter()
     themes_level_select.onchange = themes_update;
     themes_supervisor_select.onchange = themes_update;
     themes_company_select.onchange = themes_update;
+    if (themes_search_field){
+        themes_search_field.onchange = themes_update;
+    }
 }
 
 // This is Diploma Themes ?
@@ -650,6 +699,8 @@ function internships_load() {
     params.append('tag', internships_tag_select.value);
     }
 
+    facets_update('fetch_internships_facets', params);
+
     fetch('fetch_internships?' + params.toString()).then(function(response){
 
         if (!response.ok){
@@ -677,11 +728,6 @@ function internships_update() {
 
     let params = new URLSearchParams();
 
-    //if (page && page > 1){
-    //    params.append('page', page);
-    //}
-    params.append('page', 1);
-
     if (internships_format_select){
         params.append('format', internships_format_select.value);
     }
@@ -700,6 +746,8 @@ function internships_update() {
         window.history.pushState("", "", 'internships_index.html');
     }
 
+    facets_update('fetch_internships_facets', params);
+
     fetch('fetch_internships?' + params.toString())
     .then(function(response){
         if (!response.ok){
@@ -781,3 +829,61 @@ if (practice_student_filter_element || practice_admin_filter_element){
     $('[data-toggle="popoverhover"]').popover({ trigger: "hover" });
 }
 
+
+//
+// Infinite scroll: [data-more] at the end of a list holds the URL of the
+// next page, it is replaced with that page when scrolled into view or clicked
+//
+
+function load_more(more) {
+
+    if (more.dataset.loading){
+        return;
+    }
+    more.dataset.loading = 1;
+
+    fetch(more.dataset.more).then(function(response){
+
+        if (!response.ok){
+            delete more.dataset.loading;
+        } else {
+            response.text().then(function (text) {
+                more.insertAdjacentHTML('beforebegin', text);
+                more.remove();
+                feather.replace({'width': '1em', 'height': '1em'});
+                $('[data-toggle="popoverhover"]').popover({ trigger: "hover" });
+            });
+        }
+    });
+}
+
+if ('IntersectionObserver' in window){
+
+    let more_observer = new IntersectionObserver(function(entries){
+        entries.forEach(function(entry){
+            if (entry.isIntersecting){
+                load_more(entry.target);
+            }
+        });
+    }, { rootMargin: '400px' });
+
+    // Lists are loaded with fetch(), watch for every new [data-more]
+    let observe_more = function(){
+        document.querySelectorAll('[data-more]:not([data-observed])').forEach(function(more){
+            more.dataset.observed = 1;
+            more_observer.observe(more);
+        });
+    };
+
+    new MutationObserver(observe_more).observe(document.body, { childList: true, subtree: true });
+    observe_more();
+}
+
+document.addEventListener('click', function(event){
+    let more = event.target.closest('[data-more]');
+
+    if (more){
+        event.preventDefault();
+        load_more(more);
+    }
+});
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_DIR)
+
+# The databases directory is taken relative to the working directory when
+# flask_se_config is imported, here and not by a fixture, before the test
+# modules import the models. The tests must never touch src/databases.
+SITE_DIR = tempfile.mkdtemp(prefix="se_tests_")
+atexit.register(shutil.rmtree, SITE_DIR, True)
+os.chdir(SITE_DIR)
+
+
+@pytest.fixture(scope="session")
+def app():
+    """The site with a fresh database made by init."""
+    from flask_se import app
+    from se_models import init_db
+
+    with app.app_context():
+        init_db()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def statements(app):
+    """SQL statements executed while the test runs."""
+    from sqlalchemy import event
+
+    from se_models import db
+
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        executed.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
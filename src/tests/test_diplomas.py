@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import re
+
+import pytest
+
+from se_models import db, Company, DiplomaThemes, ThemesLevel, Users
+
+THEMES = 25
+
+
+@pytest.fixture(scope="module")
+def themes(app):
+    """Approved themes of different companies and levels, more than a page
+    of them. Every theme of a page has its own author and consultant, so a
+    lazy load in the template costs a query per theme."""
+    with app.app_context():
+        users = [
+            Users(email="user%d@example.com" % i, first_name="Имя", last_name="Ф%d" % i)
+            for i in range(THEMES * 2 + 6)
+        ]
+        db.session.add_all(users)
+        db.session.flush()
+        users = [u.id for u in users]
+
+        companies = [c.id for c in Company.query.order_by(Company.id)]
+        levels = ThemesLevel.query.order_by(ThemesLevel.id).all()
+        for i in range(THEMES):
+            db.session.add(
+                DiplomaThemes(
+                    title="Тема %d" % i,
+                    description="Описание темы %d" % i,
+                    status=2,
+                    levels=[levels[i % len(levels)], levels[(i + 1) % len(levels)]],
+                    company_id=companies[i % len(companies)],
+                    author_id=users[i],
+                    consultant_id=users[THEMES + i],
+                    supervisor_id=users[THEMES * 2 + i % 3],
+                    supervisor_thesis_id=users[THEMES * 2 + 3 + i % 3],
+                )
+            )
+        db.session.commit()
+
+        theme = DiplomaThemes.query.filter_by(status=2).first()
+        return {
+            "supervisor": theme.supervisor_id,
+            "company": theme.company_id,
+            "level": theme.levels[0].id,
+        }
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        (),
+        ("supervisor",),
+        ("level",),
+        ("company",),
+        ("supervisor", "level", "company"),
+    ],
+)
+def test_fetch_themes_queries(client, statements, themes, filters):
+    """A page of themes with all it shows takes at most three queries: no
+    lazy loads in fetch_themes.html, the supervisor is checked with one."""
+    params = {name: themes[name] for name in filters}
+    response = client.get("/diplomas/fetch_themes", query_string=params)
+
+    assert response.status_code == 200
+    assert "card-header" in response.get_data(as_text=True)
+    assert len(statements) <= 3, statements
+
+
+def test_fetch_themes_next_page_queries(client, statements, themes):
+    html = client.get("/diplomas/fetch_themes").get_data(as_text=True)
+    more = re.search(r'data-more="([^"]+)"', html).group(1).replace("&amp;", "&")
+
+    del statements[:]
+    response = client.get(more)
+
+    assert response.status_code == 200
+    assert "card-header" in response.get_data(as_text=True)
+    assert len(statements) <= 3, statements